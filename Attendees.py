@@ -174,7 +174,8 @@ class BaseAttendees:
     def from_probs(cls, dict_, n_attendees):
         """
         returns exactly n_attendees ticket holders, with the weight that each group size is sampled 
-        coming from dict_, which maps {groupsize -> relative_weight}
+        coming from dict_, which maps {groupsize -> relative_weight}. 
+        The size of the last group, which takes the tickets left over, is stored as remainder
         """
 
         # Convert weights into probabilities by dividing by sum
@@ -198,8 +199,12 @@ class BaseAttendees:
             groups.append(new)
             new = BaseAttendees._getweighted(probabilities)
 
-        groups.append(n_attendees - sum(groups))
-        return cls(groups, 'from_probs')
+        # the last group fills the remaining tickets instead of being drawn, remember its size
+        remainder = n_attendees - sum(groups)
+        groups.append(remainder)
+        attendees = cls(groups, 'from_probs')
+        attendees.remainder = remainder
+        return attendees
             
     @classmethod
     def _getweighted(cls, cumulative_probabilities):
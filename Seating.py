@@ -1,6 +1,15 @@
 import numpy as np
 import json
 import pickle
+import os
+import glob
+from multiprocessing import shared_memory, util
+from scipy.ndimage import distance_transform_edt
+from utils import RunIndex, FOOTPRINTS, footprint_starts, disk_stencil, stamp, get_seat_scale
+
+
+# version of the compiled layout format written by BaseSeating.to_layout
+LAYOUT_VERSION = 1
 
 
 # whats the order to put regular vs class versus getter methods
@@ -23,6 +32,15 @@ class BaseSeating:
     emptyseatcoords: set[tuple(x, y)]
         a set of tuples where each tuple represents a coordinate in seating that 
         is currently an empty seat
+    rowruns: RunIndex
+        index of the runs of consecutive empty seats in each row, sorted by length
+    layers: dict{str->np.ndarray}
+        optional precomputed per-seat float maps (e.g. risk near vents, doors or the stage),
+        the same shape as seating, that solvers can add to their placement scores
+    distance_dtype: np.dtype
+        float dtype of the pairwise distance matrices that evaluation builds for this seating,
+        float64 by default and float32 after compact(). Solvers always keep float64 distance
+        maps, so that compact mode does not change which positions they choose
 
     Methods
     -------
@@ -40,6 +58,19 @@ class BaseSeating:
     add_many(coordlist, groupid)
         adds multiple people from the same group to the seats specified
         in coordlist
+
+    add_layer(name, values)
+        adds a per-seat float layer, such as a risk map
+
+    available_seats(threshold)
+        returns a mask of the empty seats that are further than threshold from every occupied seat
+
+    remaining_capacity(groups, threshold, pack)
+        counts how many more groups of each size fit in the seating without violating threshold
+
+    compact()
+        switches the seating to compact memory mode, with an int16/int32 grid and float32 
+        evaluation matrices
     
     to_pickle(name)
         saves seating in a pickle
@@ -50,6 +81,15 @@ class BaseSeating:
     from_json(name)
         loads a seating arrangement based on parameters in a json file 
 
+    to_layout(name, dtype)
+        saves the seating as a compiled binary layout (.npy grid + json metadata)
+
+    from_layout(name, mmap_mode)
+        loads a seating from a compiled layout, memory-mapping the grid
+
+    to_shared()
+        places the seating grid in shared memory and returns a SharedVenue handle
+
     from_regular_blocks(block_dims, tiling)
         returns a seating that is made up of uniform blocks of seats spaced by 
         aisles at regular intervals
@@ -59,6 +99,8 @@ class BaseSeating:
         better one if I had the time!)
     """
 
+    distance_dtype = np.float64
+
     def __init__(self, totalseats: int, seating: np.ndarray):
         """
         Creates a BaseSeating object
@@ -73,10 +115,10 @@ class BaseSeating:
         self.totalseats = totalseats
         self.seating = seating
         self.unfilledseats = totalseats
-        self.emptyseatcoords = set((x, y) for x, y in zip(np.where(self.seating == 0)[0],
-                                                       np.where(self.seating == 0)[1]
-                                                       )
-                                )
+        empty = np.where(self.seating == 0)
+        self.emptyseatcoords = set((x, y) for x, y in zip(empty[0], empty[1]))
+        self.rowruns = RunIndex(self.seating == 0)
+        self.layers = {}
 
     def isemptyseat(self, x, y):
         """
@@ -109,6 +151,7 @@ class BaseSeating:
             self.seating[x, y] = groupid # set the seat to be filled by this group
             self.unfilledseats -= 1 # one less unfilled seat
             self.emptyseatcoords.remove((x, y)) # remove the newly filled seat from emptyseatcoords
+            self.rowruns.take(x, y) # split the run of empty seats this seat was in
             return True
 
     def add_many(self, coordlist, groupid):
@@ -118,11 +161,94 @@ class BaseSeating:
         for coord in coordlist:
             self.add_person(coord[0], coord[1], groupid)
 
+    def add_layer(self, name, values):
+        """
+        adds a per-seat layer of floats with the same shape as the seating, such as a risk map.
+        Solvers weight layers by name in their placement scores
+        """
+        values = np.asarray(values)
+        if values.shape != self.seating.shape:
+            raise ValueError('layer {} has shape {}, seating has shape {}'.format(name, values.shape, 
+                                                                              self.seating.shape))
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(float)
+        self.layers[name] = values
+
+    def available_seats(self, threshold=None):
+        """
+        returns a boolean mask of the empty seats that are further than threshold from every
+        occupied seat (every empty seat if threshold is None)
+        """
+        free = np.asarray(self.seating) == 0
+        occupied = np.asarray(self.seating) > 0
+        if threshold is None or not occupied.any():
+            return free
+        # distance from every seat to the nearest occupied seat, scaled by the seat dimensions
+        dist = distance_transform_edt(~occupied, sampling=get_seat_scale(self))
+        return free & (dist > threshold)
+
+    def remaining_capacity(self, groups=(1, 2, 3, 4), threshold=None, pack=True):
+        """
+        returns a dict mapping each group size in groups to the number of groups of that size
+        that can still be seated without coming within threshold of anyone already seated. 
+
+        With pack=True, groups of each size are packed greedily in row-major order, each one
+        blocking the seats within threshold of it, so the count is how many more groups of
+        only that size fit (a lower bound on the best packing). With pack=False the count is
+        the number of currently valid positions, which may overlap each other. 
+        """
+        available = self.available_seats(threshold)
+        stencil = None if threshold is None else disk_stencil(threshold, get_seat_scale(self))
+
+        capacity = {}
+        for group in groups:
+            starts = [(footprint, footprint_starts(available, footprint)) for footprint in FOOTPRINTS[group]]
+            if not pack:
+                capacity[group] = int(sum(valid.sum() for _, valid in starts))
+                continue
+
+            # walk the valid positions in row-major order, keeping the ones still free
+            taken = ~available
+            placed = 0
+            candidates = np.concatenate([np.column_stack(np.where(valid) + (np.full(valid.sum(), i),))
+                                         for i, (_, valid) in enumerate(starts)])
+            candidates = candidates[np.lexsort((candidates[:, 2], candidates[:, 1], candidates[:, 0]))]
+            for x, y, i in candidates.tolist():
+                coords = [(x + dx, y + dy) for dx, dy in starts[i][0]]
+                if any(taken[cx, cy] for cx, cy in coords):
+                    continue
+                placed += 1
+                for cx, cy in coords:
+                    if stencil is None:
+                        taken[cx, cy] = True
+                    else:
+                        stamp(taken, cx, cy, stencil)
+            capacity[group] = placed
+        return capacity
+
+    def compact(self):
+        """
+        switches the seating to compact memory mode: the grid is stored as int16 (int32 for
+        venues with more seats than int16 can hold group ids for), and evaluation builds its
+        pairwise distance matrices as float32. Solvers keep float64 distance maps, so they 
+        choose the same positions as in the default mode. Returns the seating
+        """
+        self.seating = np.asarray(self.seating).astype(BaseSeating._compact_dtype(self.totalseats), copy=False)
+        self.distance_dtype = np.float32
+        return self
+
+    @staticmethod
+    def _compact_dtype(totalseats):
+        # smallest int dtype that holds a group id for every seat
+        return np.int16 if totalseats <= np.iinfo(np.int16).max else np.int32
+
     def to_pickle(self, name):
         """
         saves seating in a pickle at saved/objs/[name]
         """
-        pickle.dump(open('saved/objs/{}'.format(name), 'wb'))
+        os.makedirs('saved/objs', exist_ok=True)
+        with open('saved/objs/{}'.format(name), 'wb') as f:
+            pickle.dump(self, f)
 
     @classmethod
     def from_pickle(cls, name):
@@ -132,13 +258,24 @@ class BaseSeating:
         return pickle.load(open('saved/objs/{}'.format(name), 'rb'))
 
     @classmethod
-    def from_json(cls, name):
+    def from_json(cls, name, compact=False):
         """
         loads a seating arrangement based on parameters in a json file at
-        saved/settings/[name]
+        saved/settings/[name], in compact memory mode if compact is True
         """
         inputs = json.load(open('saved/settings/{}'.format(name))) # read json
+        totalseats, seating = BaseSeating._grid_from_settings(inputs)
+        seating = cls._from_parts(totalseats, seating, inputs)
+        if compact:
+            seating.compact()
+        return seating
 
+    @staticmethod
+    def _grid_from_settings(inputs):
+        """
+        builds the seating grid described by a parsed settings json, returns
+        the total number of seats and the grid
+        """
         seating = np.zeros(inputs['dimensions']) # initialize seating with zeros
         for row in inputs['emptyrows']:
             seating[:, row] = -1 # all coords at row are not seats
@@ -155,10 +292,68 @@ class BaseSeating:
         totalseats = inputs['dimensions'][0] * inputs['dimensions'][1] + np.sum(seating)
         # add here bc non-seats are -1. 
 
+        return totalseats, seating
+
+    @classmethod
+    def _from_parts(cls, totalseats, seating, inputs):
+        """
+        creates the seating from a grid and the dict of settings/metadata it came with.
+        Subclasses that need extra parameters read them from inputs
+        """
         return cls(totalseats, seating)
 
+    def to_layout(self, name, dtype=np.int32):
+        """
+        saves the seating as a compiled layout: the grid is written with the given
+        integer dtype to saved/layouts/[name].npy, each layer as float32 to 
+        saved/layouts/[name].[layer].npy and the metadata (format version, total seats, 
+        seat dimensions, layer names) to saved/layouts/[name].json
+        """
+        info = np.iinfo(dtype)
+        if self.seating.min() < info.min or self.seating.max() > info.max:
+            raise ValueError('seating values do not fit in {}'.format(np.dtype(dtype).name))
+
+        meta = {
+            'version': LAYOUT_VERSION,
+            'shape': list(self.seating.shape),
+            'dtype': np.dtype(dtype).name,
+            'totalseats': int(self.totalseats),
+            'layers': sorted(self.layers)
+        }
+        # non-unit seat dimensions are kept so LengthWidthSeating can be restored
+        if 'seatlen' in self.__dict__.keys():
+            meta['seatlen'] = self.seatlen
+            meta['seatwidth'] = self.seatwidth
+
+        os.makedirs('saved/layouts', exist_ok=True)
+        np.save('saved/layouts/{}.npy'.format(name), self.seating.astype(dtype))
+        for layer, values in self.layers.items():
+            np.save('saved/layouts/{}.{}.npy'.format(name, layer), values.astype(np.float32))
+        with open('saved/layouts/{}.json'.format(name), 'w') as f:
+            json.dump(meta, f, indent=4)
+
     @classmethod
-    def from_regular_blocks(cls, block_dims, tiling):
+    def from_layout(cls, name, mmap_mode='c'):
+        """
+        loads a seating from the compiled layout saved/layouts/[name].npy/.json
+
+        mmap_mode is passed to np.load. The default 'c' maps the grid copy-on-write, 
+        so processes loading the same layout share its pages until they seat someone.
+        'r' gives a read-only seating (for evaluation), and None reads the grid into memory.
+        """
+        meta = json.load(open('saved/layouts/{}.json'.format(name)))
+        if meta['version'] != LAYOUT_VERSION:
+            raise ValueError('layout {} has version {}, expected {}'.format(name, meta['version'], 
+                                                                         LAYOUT_VERSION))
+
+        seating = cls._from_parts(meta['totalseats'], 
+                                  np.load('saved/layouts/{}.npy'.format(name), mmap_mode=mmap_mode), meta)
+        for layer in meta.get('layers', []):
+            seating.add_layer(layer, np.load('saved/layouts/{}.{}.npy'.format(name, layer), mmap_mode=mmap_mode))
+        return seating
+
+    @classmethod
+    def from_regular_blocks(cls, block_dims, tiling, compact=False):
         """
         returns a seating that is made up of uniform blocks of seats spaced by 
         aisles at regular intervals
@@ -167,25 +362,38 @@ class BaseSeating:
                     regular block
         tiling: a two element list or tuple that specifies the tiling of each block in
                     the x and y dimension
+        compact: if True, the seating is returned in compact memory mode
         """
         # total number of rows and cols
         xdim = (block_dims[0] * tiling[0]) + (tiling[0] - 1)
         ydim = (block_dims[1] * tiling[1]) + (tiling[1] - 1)
 
         # figure out where the aisles are in x and y axes
-        xaisles = list(range(block_dims[0], xdim-block_dims, block_dims[0]+1))
-        yaisles = list(range(block_dims[1], ydim-block_dims, block_dims[1]+1))
+        # (one aisle after every block but the last)
+        xaisles = list(range(block_dims[0], xdim, block_dims[0]+1))
+        yaisles = list(range(block_dims[1], ydim, block_dims[1]+1))
 
         # compute total number of seats
         total_seats = (block_dims[0] * block_dims[1]) * (tiling[0] * tiling[1])
 
-        # make seating
-        seating = np.zeros((xdim, ydim))
+        # make seating, directly in the compact dtype if asked for
+        seating = np.zeros((xdim, ydim), dtype=BaseSeating._compact_dtype(total_seats) if compact else float)
         seating[xaisles, :] = -1
         seating[:, yaisles] = -1
 
-        return cls(total_seats, seating)
+        seating = cls(total_seats, seating)
+        if compact:
+            seating.compact()
+        return seating
     
+    def to_shared(self):
+        """
+        places the seating grid and its seat coordinates in shared memory, and returns
+        the SharedVenue handle that worker processes use to attach a SharedSeating.
+        The caller owns the memory and must call unlink() on the handle when done
+        """
+        return SharedVenue.create(self)
+
     def display(self):
         print(self.seating.T)
     
@@ -232,17 +440,343 @@ class LengthWidthSeating(BaseSeating):
         self.seatwidth = seatwidth
 
     @classmethod
-    def from_json(cls, name):
+    def _from_parts(cls, totalseats, seating, inputs):
         """
-        Creates a LengthWidthSeating based on parameters in a json file
-        at saved/settings/[name]. Json must include field for 
-        seatlen and seatwidth
+        Creates a LengthWidthSeating from a grid and its settings/metadata, which
+        must include fields for seatlen and seatwidth
         """
-        seating = BaseSeating.from_json(name)
+        return cls(totalseats, seating, inputs['seatlen'], inputs['seatwidth'])
+
+
+def convert_settings_to_layouts(names=None, dtype=np.int32):
+    """
+    compiles seating json files in saved/settings into layouts in saved/layouts.
+    If names is None, every settings file that describes a seating is converted.
+    Returns the names of the layouts that were written
+    """
+    if names is None:
+        names = sorted(os.path.basename(path) for path in glob.glob('saved/settings/*.json'))
+
+    converted = []
+    for name in names:
         inputs = json.load(open('saved/settings/{}'.format(name)))
-        
-        seating.seatlen = inputs['seatlen']
-        seating.seatwidth = inputs['seatwidth']
+        if 'dimensions' not in inputs:
+            continue # not a seating (e.g. an attendees file)
 
-        return seating
+        # seatings with non-unit seat dimensions keep them
+        if 'seatlen' in inputs:
+            seating = LengthWidthSeating.from_json(name)
+        else:
+            seating = BaseSeating.from_json(name)
+
+        layout_name = os.path.splitext(name)[0]
+        seating.to_layout(layout_name, dtype)
+        converted.append(layout_name)
+    return converted
+
+
+class SharedVenue:
+    """
+    A small, picklable handle to a read-only venue grid and its precomputed seat
+    coordinates, stored together in one multiprocessing.shared_memory block. 
+    Only the handle is sent to worker processes, which attach to the arrays without copying.
+
+    Attributes
+    ----------
+    name: str
+        name of the shared memory block
+    shape: tuple(int, int)
+        shape of the venue grid
+    n_seats: int
+        number of coordinates holding a seat (empty or filled)
+    totalseats: int
+        total number of seats, as in BaseSeating
+    unfilledseats: int
+        number of empty seats when the venue was shared
+    seatlen, seatwidth: float or None
+        seat dimensions, if the venue was a LengthWidthSeating
+
+    Methods
+    -------
+    create(seating)
+        copies a seating into a new shared memory block and returns its handle
     
+    attach()
+        returns the shared memory block with read-only views of the grid and seat coordinates
+
+    empty_index()
+        returns the set and RunIndex of the empty seats of the venue
+
+    detach()
+        closes this process's attachment to the block, which also happens when the process exits
+
+    unlink()
+        closes and frees the shared memory block, called by the creator when done
+    """
+    dtype = np.int32
+    _attached = {} # name -> (shm, grid, seatcoords), the blocks attached in this process
+    _empty_indexes = {} # name -> (frozenset, RunIndex) of the empty seats, built in this process
+
+    def __init__(self, name, shape, n_seats, totalseats, unfilledseats, seatlen=None, seatwidth=None):
+        self.name = name
+        self.shape = tuple(shape)
+        self.n_seats = n_seats
+        self.totalseats = totalseats
+        self.unfilledseats = unfilledseats
+        self.seatlen = seatlen
+        self.seatwidth = seatwidth
+        self._shm = None # only set in the process that created the block
+
+    @classmethod
+    def create(cls, seating: BaseSeating):
+        """
+        copies the seating grid (as int32) and the (n_seats, 2) coordinates of its seats
+        into a new shared memory block
+        """
+        grid = np.asarray(seating.seating)
+        seatcoords = np.argwhere(grid != -1).astype(cls.dtype)
+
+        gridbytes = grid.size * np.dtype(cls.dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(1, gridbytes + seatcoords.nbytes))
+        np.ndarray(grid.shape, dtype=cls.dtype, buffer=shm.buf)[:] = grid
+        np.ndarray(seatcoords.shape, dtype=cls.dtype, buffer=shm.buf, offset=gridbytes)[:] = seatcoords
+
+        seatlen, seatwidth = None, None
+        if 'seatlen' in seating.__dict__.keys():
+            seatlen, seatwidth = seating.seatlen, seating.seatwidth
+
+        handle = cls(shm.name, grid.shape, len(seatcoords), seating.totalseats, 
+                     seating.unfilledseats, seatlen, seatwidth)
+        handle._shm = shm
+        return handle
+
+    def __getstate__(self):
+        # the creator's SharedMemory object stays in the creating process
+        state = dict(self.__dict__)
+        state['_shm'] = None
+        return state
+
+    def attach(self):
+        """
+        attaches to the shared memory block and returns (shm, grid, seatcoords), where
+        grid and seatcoords are read-only views into the block. shm must be kept alive
+        for as long as the views are used. A block is only attached once per process, 
+        later calls return the same shm and views
+        """
+        if self.name in SharedVenue._attached:
+            return SharedVenue._attached[self.name]
+
+        try:
+            shm = shared_memory.SharedMemory(name=self.name, track=False)
+        except TypeError: # python < 3.13 has no track argument
+            shm = shared_memory.SharedMemory(name=self.name)
+
+        gridbytes = int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+        grid = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+        seatcoords = np.ndarray((self.n_seats, 2), dtype=self.dtype, buffer=shm.buf, offset=gridbytes)
+        grid.flags.writeable = False
+        seatcoords.flags.writeable = False
+        SharedVenue._attached[self.name] = (shm, grid, seatcoords)
+        # worker processes that exit normally (e.g. after Pool.close) detach on the way out
+        util.Finalize(None, SharedVenue._detach, args=(self.name,), exitpriority=0)
+        return shm, grid, seatcoords
+
+    def empty_index(self):
+        """
+        returns (emptyseats, rowruns), a frozenset of (x, y) and a RunIndex of the seats that 
+        were empty when the venue was shared. The set is filled in row-major order, so it 
+        iterates like the emptyseatcoords of a BaseSeating of the venue. Both are built once per 
+        process and must not be modified, SharedSeating overlays its occupancy on them
+        """
+        if self.name not in SharedVenue._empty_indexes:
+            _, grid, seatcoords = self.attach()
+            empty = seatcoords[grid[seatcoords[:, 0], seatcoords[:, 1]] == 0]
+            SharedVenue._empty_indexes[self.name] = (
+                frozenset(zip(empty[:, 0].tolist(), empty[:, 1].tolist())), RunIndex(grid == 0))
+        return SharedVenue._empty_indexes[self.name]
+
+    def detach(self):
+        """
+        closes this process's attachment to the block, without freeing the block. SharedSeatings
+        of the venue in this process must not be used afterwards
+        """
+        SharedVenue._detach(self.name)
+
+    @staticmethod
+    def _detach(name):
+        SharedVenue._empty_indexes.pop(name, None)
+        attached = SharedVenue._attached.pop(name, None)
+        if attached is None:
+            return
+        shm = attached[0]
+        del attached
+        try:
+            shm.close()
+        except BufferError:
+            pass # views into the block are still alive, it is closed when they are freed
+
+    def unlink(self):
+        """
+        closes and frees the shared memory block. Must only be called by the creator,
+        after the workers are done with it
+        """
+        self.detach()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+class SharedSeating(BaseSeating):
+    """
+    A seating that attaches to a venue in shared memory instead of owning its grid. 
+    The only private state is occupancy, the seats filled since attaching, so pickling or
+    copying a SharedSeating (e.g. to send it to a worker process) only transfers the handle
+    and those deltas.
+
+    Reads go to the shared venue with occupancy overlaid: isemptyseat() checks the venue grid
+    and occupancy, and emptyseatcoords is a view that skips the occupied seats of the venue's 
+    shared empty_index() set. Copies in the same process share the attached block and index.
+
+    The seating attribute is the only dense private array, since solvers and evaluation work 
+    on whole grids. It is materialized from the venue and occupancy the first time it is 
+    accessed, as group ids in the smallest integer dtype that holds them (2 bytes per cell for
+    up to 32767 seats), and is kept up to date by add_person afterwards. rowruns is copied from 
+    the venue's index when first accessed. 
+
+    Attributes
+    ----------
+    venue: SharedVenue
+        handle to the shared venue
+    venuegrid: np.ndarray
+        read-only view of the shared venue grid
+    seatcoords: np.ndarray
+        read-only (n_seats, 2) view of the coordinates of all seats
+    occupancy: dict{tuple(x, y) -> groupid}
+        seats filled in this seating since attaching
+
+    See BaseSeating for the remaining attributes
+    """
+    def __init__(self, venue: SharedVenue, occupancy=None):
+        """
+        Creates a SharedSeating attached to venue, seating the people in occupancy
+        """
+        self.venue = venue
+        self._shm, self.venuegrid, self.seatcoords = venue.attach()
+        self.totalseats = venue.totalseats
+        self.unfilledseats = venue.unfilledseats
+        if venue.seatlen is not None:
+            self.seatlen = venue.seatlen
+            self.seatwidth = venue.seatwidth
+
+        self.layers = {}
+
+        self.occupancy = {}
+        self._grid = None
+        self._grid_dtype = BaseSeating._compact_dtype(self.totalseats)
+        self._rowruns = None
+        if occupancy is not None:
+            for (x, y), groupid in occupancy.items():
+                self.add_person(x, y, groupid)
+
+    @property
+    def seating(self):
+        """
+        dense grid of the seating, the shared venue with this seating's occupancy applied
+        """
+        if self._grid is None:
+            self._grid = np.array(self.venuegrid, dtype=self._grid_dtype)
+            for (x, y), groupid in self.occupancy.items():
+                self._grid[x, y] = groupid
+        return self._grid
+
+    @property
+    def emptyseatcoords(self):
+        """
+        read-only view of the empty seats: the shared venue's empty seats minus occupancy
+        """
+        empty, _ = self.venue.empty_index()
+        return _EmptySeats(empty, self.occupancy)
+
+    @property
+    def rowruns(self):
+        """
+        RunIndex of the empty seats, copied from the shared venue's and updated with occupancy
+        """
+        if self._rowruns is None:
+            _, rowruns = self.venue.empty_index()
+            self._rowruns = rowruns.copy()
+            for x, y in self.occupancy:
+                self._rowruns.take(x, y)
+        return self._rowruns
+
+    def isemptyseat(self, x, y):
+        """
+        checks if (x, y) is a seat of the venue that is not in occupancy
+        """
+        if not (0 <= x < self.venuegrid.shape[0] and 0 <= y < self.venuegrid.shape[1]):
+            return False
+        return self.venuegrid[x, y] == 0 and (x, y) not in self.occupancy
+
+    def compact(self):
+        """
+        switches the seating to compact memory mode, see BaseSeating.compact. The private grid
+        already holds compact group ids, so only the evaluation dtype changes. Returns the seating
+        """
+        self.distance_dtype = np.float32
+        return self
+
+    def add_person(self, x, y, groupid):
+        """
+        Tries to add a person from group groupid to the seat at (x, y), recording
+        it in occupancy. Raises a warning and does nothing if seat is not empty
+        """
+        if not self.isemptyseat(x, y):
+            raise Warning('Trying to place person at invalid location ({}, {})'.format(x, y))
+        self.occupancy[(x, y)] = groupid
+        if self._grid is not None:
+            self._grid[x, y] = groupid
+        self.unfilledseats -= 1
+        if self._rowruns is not None:
+            self._rowruns.take(x, y)
+        return True
+
+    def __getstate__(self):
+        return {'venue': self.venue, 'occupancy': dict(self.occupancy), 'layers': self.layers,
+                'compact': self.distance_dtype == np.float32}
+
+    def __setstate__(self, state):
+        self.__init__(state['venue'], state['occupancy'])
+        self.layers = state['layers']
+        if state['compact']:
+            self.compact()
+
+    def __deepcopy__(self, memo):
+        seating = SharedSeating(self.venue, dict(self.occupancy))
+        seating.layers = self.layers # layers are read-only, so they are shared
+        if self.distance_dtype == np.float32:
+            seating.compact()
+        return seating
+
+
+class _EmptySeats():
+    """
+    Read-only set-like view of the empty seats of a SharedSeating: the seats that were empty in
+    the shared venue and are not in its occupancy. Iterates in the order of the venue's set
+    """
+    __slots__ = ('_venue_empty', '_occupancy')
+
+    def __init__(self, venue_empty, occupancy):
+        self._venue_empty = venue_empty
+        self._occupancy = occupancy
+
+    def __contains__(self, coord):
+        return coord in self._venue_empty and coord not in self._occupancy
+
+    def __iter__(self):
+        occupancy = self._occupancy
+        return (coord for coord in self._venue_empty if coord not in occupancy)
+
+    def __len__(self):
+        # every seat in occupancy was empty in the venue when it was filled
+        return len(self._venue_empty) - len(self._occupancy)
@@ -1,11 +1,21 @@
-from Seating import BaseSeating
+from Seating import BaseSeating, LengthWidthSeating, SharedSeating
 from Attendees import BaseAttendees
+from collections import Counter
 from abc import abstractmethod
 import numpy as np
 import random
 import copy
+import time
+import queue
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from multiprocessing import Pool
 from scipy.spatial.distance import pdist, squareform
-from utils import MaxHeap
+from scipy.ndimage import distance_transform_edt
+from utils import MaxHeap, SampleSet, FOOTPRINTS, footprint_starts, footprint_sums, disk_stencil, stamp
+from evaluate import get_seat_scale, evaluate_nearest_distance, evaluate_closerthan_thresh
 
 
 class BaseSolver:
@@ -20,30 +30,94 @@ class BaseSolver:
     attendees: BaseAttendees
         a BaseAttendees object from which the attendees will be drawn
 
+    layer_weights: dict{str->float}
+        weights of the seating's risk layers that are added to the placement scores
+
     Methods
     -------
     solve()
         Adds all the attendees to the seating, if possible
 
+    solve_iter()
+        Generator that adds the attendees one group at a time, yielding 
+        (groupid, group size, coords, metrics) after each group is seated. It can be
+        stopped early, and the seating then holds the groups placed so far
+
     In the current implementation, groups are restricted to sizes 1-4. 
     Groups of 2 and 3 must be seated side-to-side, while groups of four may be seated
     in two rows of 2, or one row of 4.
 
     """
-    def __init__(self, seating: BaseSeating, attendees: BaseAttendees):
+    def __init__(self, seating: BaseSeating, attendees: BaseAttendees, layer_weights=None):
         """
         Creates a Solver with specified seating and attendees
+
+        layer_weights: dict{str->float}
+            weights of the seating's risk layers in the placement score, which is the distance
+            plus the weighted sum of the layers. Use negative weights for penalties
+
+        Raises a ValueError if a group has a size that cannot be seated (see FOOTPRINTS)
         """
+        unsupported = sorted(set(attendees.groups) - set(FOOTPRINTS))
+        if len(unsupported) > 0:
+            raise ValueError('unsupported group sizes {}, groups must have between {} and {} people'.format(
+                unsupported, min(FOOTPRINTS), max(FOOTPRINTS)))
         self.seating = seating
         self.attendees = attendees
+        self.layer_weights = layer_weights or {}
+        self._layer_total = None
+
+    def solve(self, *args, **kwargs):
+        """
+        Adds all the attendees to the seating by running solve_iter() to completion, takes
+        the same arguments as solve_iter()
+        """
+        for _ in self.solve_iter(*args, **kwargs):
+            pass
 
     @abstractmethod
-    def solve(self):
+    def solve_iter(self):
         """
-        Children must implement the solve() method
+        Children must implement the solve_iter() generator
         """
         pass
 
+    def _metrics(self, coords):
+        """
+        Returns the metrics yielded by solve_iter() for a group that was just seated at coords
+        """
+        return {'unfilledseats': int(self.seating.unfilledseats)}
+
+
+    def _init_distmap(self):
+        """
+        Initializes the dist_map as a copy of the seating grid, whose free seats (0) are filled 
+        in with distances as groups are placed. It is float64 even if the grid holds compact 
+        integer group ids
+        """
+        self.dist_map = self.seating.seating.astype(np.float64)
+
+    def _layer_map(self):
+        """
+        Returns the weighted sum of the seating's risk layers named in layer_weights, 
+        or None if no layers are weighted. Layers are static, so the sum is computed once
+        """
+        if not self.layer_weights:
+            return None
+        if self._layer_total is None:
+            total = np.zeros(self.seating.seating.shape)
+            for name, weight in self.layer_weights.items():
+                total += weight * self.seating.layers[name]
+            self._layer_total = total
+        return self._layer_total
+
+    def _corner_first(self, groupid):
+        """
+        Returns True if group groupid should be placed as close to 0, 0 as possible instead of
+        at the best scoring position: the first group is, unless risk layers are weighted, since
+        every position then has the same distance score
+        """
+        return groupid == 1 and self._layer_map() is None
 
     def _group_here_ok(self, group, x, y):
         """
@@ -68,27 +142,19 @@ class BaseSolver:
         Checks if it is possible to put a group of two, with one of the two seated
         at the coordinates x, y
         """
-        # seat and seat to the right are empty
-        cond1 = (self.seating.isemptyseat(x, y) and self.seating.isemptyseat(x+1, y))
-
-        # seat and seat to the left are empty
-        cond2 = (self.seating.isemptyseat(x, y) and self.seating.isemptyseat(x-1, y))
-
-        return (cond1 or cond2)
+        # the seat must be in a run of at least two empty seats, so that
+        # the seat to the left or to the right is empty as well
+        run = self.seating.rowruns.run_at(x, y)
+        return run is not None and run[1] >= 2
 
     def _3_check(self, x, y):
         """
         Checks if it is possible to put a group of three, with one of the three seated
         at the coordinates x, y
         """
-        # possible x starting positions are from range (x-3, x]
-        for start_x in range(x, x-3, -1):
-            # if any of the start positions are valid, return True
-            if self._check_row(start_x, start_x+3, y):
-                return True
-
-        # if all possible start positions are not valid, return False
-        return False
+        # the seat must be in a run of at least three empty seats
+        run = self.seating.rowruns.run_at(x, y)
+        return run is not None and run[1] >= 3
 
     def _make_row(self, start_x, size, y):
         """
@@ -113,11 +179,9 @@ class BaseSolver:
         """
         Checks if all coords between range[start_x, end_x) at row y are empty seats
         """
-        for i in range(start_x, end_x):
-            # if any coords are not valid, return False
-            if not self.seating.isemptyseat(i, y):
-                return False
-        return True
+        # they are if the run of empty seats containing start_x reaches end_x
+        run = self.seating.rowruns.run_at(start_x, y)
+        return run is not None and run[0] + run[1] >= end_x
 
     def _check_box(self, start_x, start_y):
         """
@@ -140,11 +204,10 @@ class BaseSolver:
         four is at coordinates x, y
         """
 
-        # specify the range of possible row starts
-        for start_x in range(x, x-4, -1):
-            # if any of these rows are possible we can return True
-            if self._check_row(start_x, start_x+4, y):
-                return True
+        # a row is possible if the seat is in a run of at least four empty seats
+        run = self.seating.rowruns.run_at(x, y)
+        if run is not None and run[1] >= 4:
+            return True
         
         # specify the possible box upper-left start coordinates
         box_start_coords = [(x, y), (x-1, y), (x, y-1), (x-1, y-1)]
@@ -190,20 +253,28 @@ class BaseSolver:
 
 class NaiveSolver(BaseSolver):
     """
-    A naive solver that selects coordinates at random and tries to add a group at 
-    that location, until all groups have been added. 
+    A naive solver that places each group at a position chosen uniformly at random from
+    all the positions where it currently fits, until all groups have been added. 
 
     Useful as a baseline but not good. Also outlines the basic logic flow of a solver
+
+    Instead of drawing random seats until one works, the solver keeps the valid positions of
+    every group size in a SampleSet, built once with vectorized footprint masks. Placing a
+    group only removes the positions overlapping its seats, so each draw is O(1) and each
+    placement costs O(group size * footprint size), even when the venue is nearly full. 
     """
-    def solve(self):
+    def solve_iter(self):
         """
-        Naively solves by selecting a coordinate at random from the empty coordinates, 
-        and tries to add a group with one member of the group at that coordinate. 
-
-        This is an ugly function, but I'm leaving it as is because it's how I originally
-        coded it up and this is supposed to be a naive implementation. See ExhaustiveGreedySolver
-        for a cleaner code solver. 
+        Naively solves by placing the largest remaining group at a uniformly random valid 
+        position, raising a RuntimeError if a group does not fit anywhere. 
         """
+        # valid positions (x, y, footprint index) of each group size
+        free = self.seating.seating == 0
+        self.candidates = {}
+        for group, footprints in FOOTPRINTS.items():
+            self.candidates[group] = SampleSet(
+                (x, y, i) for i, footprint in enumerate(footprints)
+                for x, y in np.argwhere(footprint_starts(free, footprint)).tolist())
         
         # we must specify groupids to know which individual belongs to which group later
         # we initialize with 1 and increment. 
@@ -215,91 +286,41 @@ class NaiveSolver(BaseSolver):
             # select the largest group
             curr = self.attendees.pop_largest()
 
-            # select a random coordinate that has an empty seat            
-            coords = random.choice(tuple(self.seating.emptyseatcoords))
-
-            # remember which seats we couldn't add this group at
-            failed_seats = set()
-
-            # if we can add this group, continue, but if we cannot, we keep 
-            # trying to select new coordinates. 
-            while not self._group_here_ok(curr, coords[0], coords[1]):
-                failed_seats.add(coords)
-
-                # if we have run out of empty seats, we will know when 
-                # we have as many unique failed seats as empty seat coordinates
-                if len(failed_seats) == len(self.seating.emptyseatcoords):
-                    # this means we cannot place this group at all, so raise an error
-                    raise RuntimeError
+            # if there are no valid positions left, we cannot place this group at all
+            if len(self.candidates[curr]) == 0:
+                raise RuntimeError('no room left for a group of {}'.format(curr))
 
-                # otherwise, keep trying to select a seat at random. 
-                coords = random.choice(tuple(self.seating.emptyseatcoords))
-            
-            # now, coords is a valid place to start. 
-            x, y = coords[0], coords[1]
-
-            # simple case, add the person to this spot
-            if curr == 1:
-                self.seating.add_person(x, y, groupid)
-            
-            if curr == 2:
-                # we know at least this coord is valid
-                self.seating.add_person(x, y, groupid)
-                # now try to add to the right
-                if self.seating.isemptyseat(x+1, y):
-                    self.seating.add_person(x+1, y, groupid)
-                # since there was a valid placement (because _group_here_ok passed)
-                # we know we must be able to place to the left
-                else:
-                    self.seating.add_person(x-1, y, groupid)
-
-            if curr == 3:
-                # again, add to this coordinate
-                self.seating.add_person(x, y, groupid)
-                # if both seats to the right are free, add there
-                if self.seating.isemptyseat(x+1, y) and self.seating.isemptyseat(x+2, y):
-                    self.seating.add_person(x+1, y, groupid)
-                    self.seating.add_person(x+2, y, groupid)
-                # else if one seat to the right and one seat to the left is free
-                elif self.seating.isemptyseat(x+1, y) and self.seating.isemptyseat(x-1, y):
-                    self.seating.add_person(x+1, y, groupid)
-                    self.seating.add_person(x-1, y, groupid)
-                else: # both seats to the left must be free
-                    self.seating.add_person(x-1, y, groupid)
-                    self.seating.add_person(x-2, y, groupid)
-
-            if curr == 4:
-                # separate function for placement
-                self._4_place(x, y, groupid)
+            # select a random valid position and add the group there
+            x, y, i = self.candidates[curr].sample()
+            coords = [(x + dx, y + dy) for dx, dy in FOOTPRINTS[curr][i]]
+            self.seating.add_many(coords, groupid)
+            self._remove_candidates(coords)
+            yield groupid, curr, coords, self._metrics(coords)
             
             groupid += 1
 
-    def _4_place(self, x, y, groupid):
+    def _remove_candidates(self, coords):
         """
-        Function to handle placement of a group of four in a row or box, with one person at x, y
+        Removes every position of every group size that covers one of the newly filled seats
         """
-        # first we check rows
-        for start_x in range(x, x-4, -1): # for all possible row starts
-            if self._check_row(start_x, start_x+4, y): # if this row is valid
-                # add it and terminate
-                self.seating.add_many(self._make_row(start_x, 4, y), groupid)
-                return
-
-        # if no rows were valid, we check boxes
-        box_start_coords = [(x, y), (x-1, y), (x, y-1), (x-1, y-1)]
-        for x, y in box_start_coords:
-            if self._check_box(x, y): # if this box is valid
-                # add this box and terminate
-                self._add_box(x, y, groupid)
-                return
+        for x, y in coords:
+            for group, footprints in FOOTPRINTS.items():
+                for i, footprint in enumerate(footprints):
+                    for dx, dy in footprint:
+                        self.candidates[group].discard((x - dx, y - dy, i))
 
 class PrioritySolver(BaseSolver):
     """
     A solver that maintains a map that stores the distance to the nearest occupied
     seat for each coordinate, and a max heap that yields the coordinate that has a 
     seat that is furthest from an occupied seat. 
+
+    The distance map is recomputed with the backend named by distmap_backend: 'edt' runs
+    one exact euclidean distance transform over the grid, 'pdist' ranks the pairwise 
+    distances between all seats. 
     """
-    def solve(self, order='descending'):
+    distmap_backend = 'edt'
+    def solve_iter(self, order='descending'):
         """
         Solves by trying to place a group with one person seated at the seat yielded
         by the max heap. If not possible at this seat, tries the next best seat. 
@@ -310,9 +331,9 @@ class PrioritySolver(BaseSolver):
         Once a valid seat has been found add at, we add the rest of the group members 
         to the arrangement that maximizes distance to other occupied seats
         """
-        # heapify the coordinates and initialize the dist_map and groupid
+        # initialize the dist_map, heapify the coordinates and initialize the groupid
+        self._init_distmap()
         self._heapify_coords()
-        self.dist_map = copy.copy(self.seating.seating)
         groupid = 1
 
         # while not everyone has been placed
@@ -352,19 +373,24 @@ class PrioritySolver(BaseSolver):
             x, y = coords[0], coords[1]
             if curr == 1:
                 self.seating.add_person(x, y, groupid)
+                placed = [(x, y)]
             elif curr == 2:
                 self.seating.add_person(x, y, groupid)
                  # add to the better of the two possible locations
                 next_x, next_y = self._2_best(x, y)
                 self.seating.add_person(next_x, next_y, groupid)
+                placed = [(x, y), (next_x, next_y)]
             elif curr == 3:
                 # add to the best row including this seat
                 next_adds = self._3_best(x, y)
                 self.seating.add_many(next_adds, groupid)
+                placed = next_adds
             elif curr == 4:
                 # add to the best row or box including this seat
                 four_add = self._4_best(x, y)
                 self.seating.add_many(four_add, groupid)
+                placed = four_add
+            metrics = self._metrics(placed)
             
             # update the distmap, this will also mean the priorities
             # in our heap must be updated
@@ -373,16 +399,18 @@ class PrioritySolver(BaseSolver):
             # apply both the heap updates and return the coordinates that were popped
             # while looking for a valid group placement area, back to the heap
             self._update_coordheap(heap_updates, to_push_end)
+            yield groupid, curr, placed, metrics
             groupid += 1
 
     def _heapify_coords(self):
         """
         Initialize the max priority heap with the empty seat coordinates. 
-        All seats start with the same priority of 0.
+        All seats start with the same distance of 0, so their priority is only 
+        their weighted risk layers, see _score_at
         """
         coordheap = MaxHeap()
         for coord in self.seating.emptyseatcoords:
-            coordheap.push(0, coord)
+            coordheap.push(self._score_at(coord[0], coord[1]), coord)
         self.coordheap = coordheap
 
     def _update_distmap(self):
@@ -396,6 +424,9 @@ class PrioritySolver(BaseSolver):
                  is closer
             Return a dict of updates to be made to the coordheap
         """
+        if self.distmap_backend == 'edt':
+            return self._update_distmap_edt()
+
         # get all seats
         all_seats = np.where(self.seating.seating != -1) # we don't care about aisles heres
         all_seats = [(x, y) for x, y in zip(all_seats[0], all_seats[1])]
@@ -403,14 +434,15 @@ class PrioritySolver(BaseSolver):
 
         # if the Seating we are using specifies non-unit height and width of seats, 
         # we must modify the (x, y) coordinates of the seats accordingly. 
+        scaled_seats = all_seats.astype(np.float64)
         if 'seatlen' in self.seating.__dict__.keys():
-            # since the coordinates in all_seats are currently in unit-scale, 
-            # we need to just multiply by the actual seatlen and seatwidth to get
-            # the new coordinate system
-            all_seats[:, 0] = all_seats[:, 0] * self.seating.seatwidth
-            all_seats[:, 1] = all_seats[:, 1] * self.seating.seatlen
+            # since the coordinates in all_seats are in unit-scale, we need to just multiply 
+            # a float copy by the actual seatlen and seatwidth to get the new coordinate system.
+            # all_seats stays in unit-scale, to index the seating and distmap
+            scaled_seats[:, 0] = scaled_seats[:, 0] * self.seating.seatwidth
+            scaled_seats[:, 1] = scaled_seats[:, 1] * self.seating.seatlen
 
-        dmat = squareform(pdist(all_seats))
+        dmat = squareform(pdist(scaled_seats))
 
         # We only want to update the free seats
         free_seats = np.where(self.seating.seating == 0)
@@ -447,6 +479,90 @@ class PrioritySolver(BaseSolver):
         # at the end we return the coordheap updates
         return coordheap_updates
 
+    def _update_distmap_edt(self):
+        """
+        Same as _update_distmap, but recomputes the distance from every coordinate to the
+        nearest occupied seat with a single euclidean distance transform, scaled by the 
+        seat dimensions. Only the free seats of the distmap are updated, aisles keep -1. 
+        """
+        occupied = self.seating.seating > 0
+        if not occupied.any():
+            return {} # nothing to measure distances to yet
+
+        # the distance transform measures the distance to the nearest zero, i.e. occupied seat
+        dist = distance_transform_edt(~occupied, sampling=get_seat_scale(self.seating))
+        dist = dist.astype(self.dist_map.dtype, copy=False) # so unchanged distances compare equal
+
+        changed = (self.seating.seating == 0) & (dist != self.dist_map)
+        self.dist_map[changed] = dist[changed]
+        return {(x, y): self.dist_map[x, y] for x, y in zip(*np.where(changed))}
+
+    def _update_distmap_near(self, coords):
+        """
+        Same as _update_distmap, but only for the group just seated at coords: the free seats 
+        are lowered to their distance to coords where that is closer than their previous nearest
+        occupied seat. No free seat is further than the largest distance in the distmap from its
+        nearest occupied seat, so only the window within that distance of coords is updated
+        """
+        free = self.seating.seating == 0
+        if not free.any():
+            return {}
+        scale = get_seat_scale(self.seating)
+        first = (self.seating.seating > 0).sum() == len(coords)
+        if not first:
+            reach = self.dist_map[free].max()
+            xreach = int(np.ceil(reach / scale[0]))
+            yreach = int(np.ceil(reach / scale[1]))
+        else:
+            # these are the first occupied seats, so there is no previous distance
+            xreach, yreach = self.dist_map.shape
+
+        xs_new = [x for x, _ in coords]
+        ys_new = [y for _, y in coords]
+        xlen, ylen = self.dist_map.shape
+        window = (slice(max(min(xs_new) - xreach, 0), min(max(xs_new) + xreach + 1, xlen)), 
+                  slice(max(min(ys_new) - yreach, 0), min(max(ys_new) + yreach + 1, ylen)))
+        xs, ys = np.ogrid[window]
+        new = np.min([np.sqrt(((xs - x) * scale[0]) ** 2 + ((ys - y) * scale[1]) ** 2)
+                      for x, y in coords], axis=0)
+
+        dist = self.dist_map[window]
+        changed = free[window]
+        if not first:
+            changed &= new < dist
+        dist[changed] = new[changed]
+        x0, y0 = window[0].start, window[1].start
+        return {(x0 + x, y0 + y): dist[x, y] for x, y in zip(*np.where(changed))}
+
+    def _metrics(self, coords):
+        """
+        Returns the metrics yielded by solve_iter() for a group that was just seated at coords,
+        which must be called before the dist_map is updated: the distance from the group to the 
+        nearest occupied seat (nan for the first group) and the number of unfilled seats
+        """
+        distance = min(self.dist_map[x, y] for x, y in coords)
+        return {'distance': float(distance) if distance > 0 else np.nan, 
+                'unfilledseats': int(self.seating.unfilledseats)}
+
+    def _score_map(self):
+        """
+        Returns the map used to score positions: the dist_map, plus the weighted risk layers
+        if the solver has layer_weights
+        """
+        layers = self._layer_map()
+        if layers is None:
+            return self.dist_map
+        return self.dist_map + layers
+
+    def _score_at(self, x, y):
+        """
+        Returns the score of a single seat, see _score_map
+        """
+        layers = self._layer_map()
+        if layers is None:
+            return self.dist_map[x, y]
+        return self.dist_map[x, y] + layers[x, y]
+
     def _update_coordheap(self, updates, to_push_end):
         """
         Function that updates the coordheap
@@ -454,16 +570,16 @@ class PrioritySolver(BaseSolver):
             - re-adding the coordinates that were popped while trying
                 to find a valid starting coordinate
         """
-        # the update value should be in updates[coords]
+        # the updated seats are rescored from the dist_map, with their risk layers
         for i in range(len(self.coordheap)):
             coords = self.coordheap[i][1]
             if coords in updates.keys():
-                self.coordheap[i] = (updates[coords], coords)
+                self.coordheap[i] = (self._score_at(coords[0], coords[1]), coords)
         # updating the values manually means we need to restore the heap state
         self.coordheap.heapify()
         
         for x, y in to_push_end:
-            self.coordheap.push(self.dist_map[x, y], (x, y))
+            self.coordheap.push(self._score_at(x, y), (x, y))
 
     def _2_best(self, x, y):
         """
@@ -476,9 +592,9 @@ class PrioritySolver(BaseSolver):
         elif self.seating.isemptyseat(x-1, y) and not self.seating.isemptyseat(x+1, y):
             return x-1, y
         # otherwise, select the seat that has a higher dist_map value
-        elif self.dist_map[x+1, y] > self.dist_map[x-1, y]:
+        elif self._score_at(x+1, y) > self._score_at(x-1, y):
             return x+1, y
-        else: # self.dist_map[x-1, y] >= self.dist_map[x+1, y]
+        else: # self._score_at(x-1, y) >= self._score_at(x+1, y)
             return x-1, y
 
     def _3_best(self, x, y):
@@ -499,7 +615,7 @@ class PrioritySolver(BaseSolver):
         """
         dists = []
         for x, y in coord_set:
-            dists.append(self.dist_map[x, y])
+            dists.append(self._score_at(x, y))
         return np.mean(dists)
 
 
@@ -545,16 +661,35 @@ class ExhaustiveGreedySolver(PrioritySolver):
     it always picks the best possible position for the current group. 
     """
 
-    def solve(self, order='descending'):
+    def solve_iter(self, order='descending', cache=None):
         """
         Function that solves the seating by greedily picking the best location
         for a given group. 
+
+        With order='descending' the result only depends on the seating and the group sizes, so a
+        SolveCache can be passed as cache. A cached result for the same seating and group sizes is
+        replayed without solving, and otherwise the placements of the largest groups are replayed
+        from the cached result that shares the longest run of largest groups. 
         """
 
-        # initialize dist_map
-        self.dist_map = copy.deepcopy(self.seating.seating)
+        self._init_distmap()
         groupid = 1
 
+        use_cache = cache is not None and order == 'descending'
+        if use_cache:
+            key = cache.key(self.seating, (type(self).__name__, order), self.attendees.groups, self._layer_map())
+            self.cache_key = key
+            placements = cache.prefix(key)
+
+            # replay the cached placements and their metrics, and skip their groups
+            for size, coords, metrics in placements:
+                self.seating.add_many(coords, groupid)
+                self.attendees.pop_largest()
+                yield groupid, size, coords, dict(metrics)
+                groupid += 1
+            if len(placements) > 0:
+                _ = self._update_distmap()
+
         # while there are attendees left to seat
         while not self.attendees.check_complete():
             # pop a group
@@ -567,19 +702,26 @@ class ExhaustiveGreedySolver(PrioritySolver):
 
             # check every possible position for the group
             if curr == 1:
-                self._add_one(groupid)
+                coords = self._add_one(groupid)
             elif curr == 2:
-                self._add_two(groupid)
+                coords = self._add_two(groupid)
             elif curr == 3:
-                self._add_three(groupid)
+                coords = self._add_three(groupid)
             elif curr == 4:
-                self._add_four(groupid)
+                coords = self._add_four(groupid)
+            metrics = self._metrics(coords)
+            if use_cache:
+                placements.append((curr, coords, dict(metrics)))
             
             # update distmap to reflect added group, can ignore  
             # the coordheap updates
             _ = self._update_distmap()
+            yield groupid, curr, coords, metrics
             groupid += 1
 
+        if use_cache:
+            cache.put(key, placements)
+
     def _add_one(self, groupid):
         """
         Function that finds the best coordinates to seat a single person,
@@ -587,22 +729,24 @@ class ExhaustiveGreedySolver(PrioritySolver):
         """
         coordlist = [] # valid locations
         distlist = [] # distance at each valid location
+        score_map = self._score_map() # distances, plus weighted risk layers
         
         # build up these lists
         for x, y in self.seating.emptyseatcoords:
             coordlist.append((x, y))
-            distlist.append(self.dist_map[x, y])
+            distlist.append(score_map[x, y])
         
         # finds the best coordinate and seats the person there
         best_x, best_y = coordlist[np.argmax(distlist)]
 
         # However if we are placing the first group, we will pick the set of
         # valid coordinates, which are as close to 0, 0 as possible
-        if groupid == 1:
+        if self._corner_first(groupid):
             sums = [np.array(coords).sum() for coords in coordlist]
             best_x, best_y = coordlist[np.argmin(sums)]
 
         self.seating.add_person(best_x, best_y, groupid)
+        return [(best_x, best_y)]
     
     def _add_two(self, groupid):
         """
@@ -611,26 +755,24 @@ class ExhaustiveGreedySolver(PrioritySolver):
         """
         coordlist = [] # valid positions
         distlist = [] # sum of distances for this position
+        score_map = self._score_map() # distances, plus weighted risk layers
         
-        # build up these lists
-        for x, y in self.seating.emptyseatcoords:
-            # just need to check if seat to the right is empty, 
-            # since if seat to the left is empty, this pair will be included
-            # when x, y is the seat to the left. 
-            if (x+1, y) in self.seating.emptyseatcoords:
-                coordlist.append([(x, y), (x+1, y)])
-                distlist.append(self.dist_map[x, y] + self.dist_map[x+1, y])
+        # build up these lists from every pair of empty seats in the row runs
+        for x, y in self.seating.rowruns.positions(2):
+            coordlist.append([(x, y), (x+1, y)])
+            distlist.append(score_map[x, y] + score_map[x+1, y])
         
         # selects the best position with highest distance, and seats the people there
         best_coords = coordlist[np.argmax(distlist)]
 
         # However if we are placing the first group, we will pick the set of
         # valid coordinates, which are as close to 0, 0 as possible
-        if groupid == 1:
+        if self._corner_first(groupid):
             sums = [np.array(coords).sum() for coords in coordlist]
             best_coords = coordlist[np.argmin(sums)]
 
         self.seating.add_many(best_coords, groupid)
+        return best_coords
 
     def _add_three(self, groupid):
         """
@@ -639,26 +781,24 @@ class ExhaustiveGreedySolver(PrioritySolver):
         """
         coordlist = [] # valid positions
         distlist = [] # sum of distances for this position
+        score_map = self._score_map() # distances, plus weighted risk layers
 
-        for x, y in self.seating.emptyseatcoords:
-            # similar to add_two, just need to check if the two seats to the right are open
-            cond1 = (x+1, y) in self.seating.emptyseatcoords
-            cond2 = (x+2, y) in self.seating.emptyseatcoords
-            if cond1 and cond2:
-                # add to the coordlist and distlist
-                coordlist.append([(x, y), (x+1, y), (x+2, y)])
-                distlist.append(self.dist_map[x, y] + self.dist_map[x+1, y] + self.dist_map[x+2, y])
+        # similar to add_two, every three empty seats in a row run
+        for x, y in self.seating.rowruns.positions(3):
+            coordlist.append([(x, y), (x+1, y), (x+2, y)])
+            distlist.append(score_map[x, y] + score_map[x+1, y] + score_map[x+2, y])
         
         # select best position with highest distance, seats the group there
         best_coords = coordlist[np.argmax(distlist)]
 
         # However if we are placing the first group, we will pick the set of
         # valid coordinates, which are as close to 0, 0 as possible
-        if groupid == 1:
+        if self._corner_first(groupid):
             sums = [np.array(coords).sum() for coords in coordlist]
             best_coords = coordlist[np.argmin(sums)]
 
         self.seating.add_many(best_coords, groupid)
+        return best_coords
 
     def _add_four(self, groupid):
         """
@@ -667,30 +807,1055 @@ class ExhaustiveGreedySolver(PrioritySolver):
         """
         coordlist = [] # valid positions
         distlist = [] # sum of distances for this position
+        score_map = self._score_map() # distances, plus weighted risk layers
+
+        # rows come straight from the runs of at least four empty seats
+        for x, y in self.seating.rowruns.positions(4):
+            coordlist.append(self._make_row(x, 4, y))
+            distlist.append(score_map[x, y] + score_map[x+1, y] + score_map[x+2, y] + score_map[x+3, y])
 
         for x, y in self.seating.emptyseatcoords:
-            # checking if rows and boxes are valid, adding them and their distances if they are
-            if self._check_row(x, x+4, y):
-                coordlist.append(self._make_row(x, 4, y))
-                distlist.append(self.dist_map[x, y] + self.dist_map[x+1, y] + self.dist_map[x+2, y] + self.dist_map[x+3, y])
+            # checking if boxes are valid, adding them and their distances if they are
             if self._check_box(x, y):
                 coordlist.append(self._make_box(x, y))
-                distlist.append(self.dist_map[x, y] + self.dist_map[x+1, y] + self.dist_map[x, y+1] + self.dist_map[x+1, y+1])
+                distlist.append(score_map[x, y] + score_map[x+1, y] + score_map[x, y+1] + score_map[x+1, y+1])
 
         # selecting best position and seating group at this position.
         best_coords = coordlist[np.argmax(distlist)]
 
         # However if we are placing the first group, we will pick the set of
         # valid coordinates, which are as close to 0, 0 as possible
-        if groupid == 1:
+        if self._corner_first(groupid):
             sums = [np.array(coords).sum() for coords in coordlist]
             best_coords = coordlist[np.argmin(sums)]
 
         self.seating.add_many(best_coords, groupid)
+        return best_coords
 
 
-            
+def venue_key(seating: BaseSeating, layers=None):
+    """
+    Returns a hash of the state of a seating (its grid and seat dimensions), and of the weighted
+    risk layers a solver adds to its scores if any, used to recognize the same venue in a SolveCache
+    """
+    digest = hashlib.sha1()
+    digest.update(str(seating.seating.shape).encode())
+    digest.update(np.ascontiguousarray(seating.seating, dtype=np.float64).tobytes())
+    digest.update(str(get_seat_scale(seating)).encode())
+    if layers is not None:
+        digest.update(b'layers')
+        digest.update(np.ascontiguousarray(layers, dtype=np.float64).tobytes())
+    return digest.hexdigest()
 
-        
 
+class SolveCache():
+    """
+    A least-recently-used cache of deterministic solves, keyed by (venue hash, solver config,
+    group sizes in descending order). Each entry holds the placements, as a list of 
+    (group size, coords, metrics) in the order the groups were seated, where metrics are the
+    ones solve_iter() yielded for the group, and a dict of metrics that callers can attach to
+    the result. 
+
+    Methods
+    -------
+    key(seating, config, groups, layers)
+        returns the cache key for solving groups on seating with the solver config and weighted layers
+
+    get(key)
+        returns the entry for key, or None
+
+    put(key, placements, metrics)
+        stores an entry, evicting the least recently used one if the cache is full
+
+    prefix(key)
+        returns the placements of the largest groups that a cached entry shares with key
+    
+    The keys of each (venue, config) are also kept in a trie over their group sizes, so prefix()
+    costs O(groups) instead of scanning every entry. Every trie node is a dict
+    {'children': {size -> node}, 'keys': set of the keys of the entries below it}
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._tries = {} # (venue, config) -> root node of the trie of group sizes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, seating: BaseSeating, config, groups, layers=None):
+        """
+        returns the cache key for solving groups on seating with the solver config, where layers
+        is the weighted sum of risk layers the solver scores with (None if unweighted)
+        """
+        return (venue_key(seating, layers), config, tuple(sorted(groups, reverse=True)))
+
+    def get(self, key):
+        """
+        returns the entry {'placements', 'metrics'} stored for key, or None
+        """
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, placements, metrics=None):
+        """
+        stores the placements (and metrics) for key
+        """
+        if key not in self._entries:
+            self._index(key)
+        self._entries[key] = {'placements': list(placements), 'metrics': dict(metrics or {})}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self._unindex(evicted)
+
+    def _index(self, key):
+        """
+        adds key to the trie of its venue and config
+        """
+        venue, config, groups = key
+        node = self._tries.setdefault((venue, config), {'children': {}, 'keys': set()})
+        node['keys'].add(key)
+        for size in groups:
+            node = node['children'].setdefault(size, {'children': {}, 'keys': set()})
+            node['keys'].add(key)
+
+    def _unindex(self, key):
+        """
+        removes key from the trie of its venue and config, pruning the nodes left empty
+        """
+        venue, config, groups = key
+        root = self._tries[(venue, config)]
+        path = [root]
+        for size in groups:
+            path.append(path[-1]['children'][size])
+        for node in path:
+            node['keys'].discard(key)
+        for parent, size, node in reversed(list(zip(path[:-1], groups, path[1:]))):
+            if len(node['keys']) == 0:
+                del parent['children'][size]
+        if len(root['keys']) == 0:
+            del self._tries[(venue, config)]
+
+    def prefix(self, key):
+        """
+        returns a copy of the placements of the longest run of largest groups that a cached entry 
+        for the same venue and solver config shares with key (all of them for a cache hit)
+        """
+        venue, config, groups = key
+        node = self._tries.get((venue, config))
+        if node is None:
+            return []
+
+        # follow the group sizes down the trie, as far as some cached entry goes
+        shared = 0
+        for size in groups:
+            if size not in node['children']:
+                break
+            node = node['children'][size]
+            shared += 1
+        if shared == 0:
+            return []
+        other = next(iter(node['keys']))
+        return list(self._entries[other]['placements'][:shared])
+
+
+class LazyGreedySolver(ExhaustiveGreedySolver):
+    """
+    A solver that, like ExhaustiveGreedySolver, places each group at a valid position with the
+    greatest sum of distances, but keeps one max heap of candidate positions per group size 
+    instead of rescanning every empty seat for every group. 
+
+    It is a different greedy: positions with equal scores are common on regular grids, and the
+    heaps break these ties differently from ExhaustiveGreedySolver's scan, so after the first tie
+    the two solvers usually produce different seatings. 
+
+    After a group is placed, the distances are only updated in the window around it that they
+    can reach, and only the positions that contain a seat whose distance changed are rescored 
+    and pushed again. Positions that are no longer valid, or whose score is stale, are 
+    dropped lazily when they reach the top of a heap. 
+    """
+
+    def solve_iter(self, order='descending'):
+        """
+        Function that solves the seating by greedily picking the best location
+        for a given group from the candidate heaps. 
+        """
+        self._init_distmap()
+        self._build_heaps()
+        groupid = 1
+
+        # while there are attendees left to seat
+        while not self.attendees.check_complete():
+            # pop a group
+            if order == 'descending':
+                curr = self.attendees.pop_largest()
+            elif order == 'ascending':
+                curr = self.attendees.pop_smallest()
+            elif order == 'random':
+                curr = self.attendees.pop_random()
 
+            if self._corner_first(groupid):
+                # the first group goes as close to 0, 0 as possible, as in ExhaustiveGreedySolver
+                selection = {
+                    1: self._add_one,
+                    2: self._add_two,
+                    3: self._add_three,
+                    4: self._add_four
+                }
+                coords = selection[curr](groupid)
+            else:
+                coords = self._pop_best(curr)
+                self.seating.add_many(coords, groupid)
+            metrics = self._metrics(coords)
+
+            # update distmap near the group, and rescore the positions touching the seats that changed
+            updates = self._update_distmap_near(coords)
+            self._rescore(updates.keys())
+            yield groupid, curr, list(coords), metrics
+            groupid += 1
+
+    def _build_heaps(self):
+        """
+        Initialize one max heap per group size with every valid position for that size
+        """
+        self.candidate_heaps = {size: MaxHeap() for size in FOOTPRINTS}
+        self._scores = {} # current score of each position in the heaps
+
+        # every free seat is new, so every valid position is scored
+        self._rescore(list(zip(*np.where(self.seating.seating == 0))))
+
+    def _rescore(self, changed):
+        """
+        Rescores every still valid position that contains one of the changed seats. Only the
+        window around the changed seats that such positions can reach is scored, with the 
+        vectorized footprint masks
+        """
+        if not changed:
+            return
+        xs_changed = [x for x, _ in changed]
+        ys_changed = [y for _, y in changed]
+        reach = max(max(max(dx, dy) for dx, dy in footprint) 
+                    for footprints in FOOTPRINTS.values() for footprint in footprints)
+        xlen, ylen = self.dist_map.shape
+        x0, y0 = max(min(xs_changed) - reach, 0), max(min(ys_changed) - reach, 0)
+        window = (slice(x0, min(max(xs_changed) + reach + 1, xlen)), 
+                  slice(y0, min(max(ys_changed) + reach + 1, ylen)))
+
+        free = self.seating.seating[window] == 0
+        score_map = self._score_map()[window]
+        touched = np.zeros(free.shape, dtype=np.int64)
+        touched[np.array(xs_changed) - x0, np.array(ys_changed) - y0] = 1
+        for size, footprints in FOOTPRINTS.items():
+            for footprint in footprints:
+                # every valid placement of this footprint that covers a changed seat
+                starts = footprint_starts(free, footprint) & (footprint_sums(touched, footprint) > 0)
+                xs, ys = np.where(starts)
+                scores = footprint_sums(score_map, footprint)[xs, ys].tolist()
+                for x, y, score in zip((xs + x0).tolist(), (ys + y0).tolist(), scores):
+                    coords = tuple((x + dx, y + dy) for dx, dy in footprint)
+                    self._scores[coords] = score
+                    self.candidate_heaps[size].push(score, coords)
+
+        # drop the stale entries once they outnumber the live ones
+        for size, heap in self.candidate_heaps.items():
+            if len(heap) > 4 * len(self._scores) + 64:
+                self._compact(size)
+
+    def _compact(self, size):
+        """
+        Rebuilds the heap for a group size from the valid positions with their current scores
+        """
+        heap = MaxHeap()
+        for coords, score in self._scores.items():
+            if len(coords) == size and self.seating.areemptyseats(coords):
+                heap.push(score, coords)
+        self.candidate_heaps[size] = heap
+
+    def _pop_best(self, size):
+        """
+        Pops the best valid position for a group of size size, discarding positions
+        that are no longer valid or were rescored since they were pushed
+        """
+        heap = self.candidate_heaps[size]
+        while len(heap) > 0:
+            score, coords = heap.pop()
+            if not self.seating.areemptyseats(coords):
+                self._scores.pop(coords, None) # a seat was taken
+                continue
+            if score != self._scores[coords]:
+                continue # a newer entry exists for this position
+            return coords
+        raise RuntimeError('no room left for a group of {}'.format(size))
+
+
+class ThresholdSolver(ExhaustiveGreedySolver):
+    """
+    A solver that puts the social distancing threshold first. It keeps a blocked mask of
+    every seat within threshold of an already placed group, and only places a group where
+    none of its seats are blocked, choosing among those positions the one with the greatest
+    distance like ExhaustiveGreedySolver. 
+
+    Blocking uses a precomputed disk stencil (scaled by the seat dimensions) stamped around each
+    new seat with array slicing, so each placement updates the mask in O(stencil). Candidate
+    positions are found with vectorized footprint masks, so can_place() tells immediately
+    whether a violation-free placement still exists for a group size. If none exists, the group
+    is placed at the best free position anyway and violation_free becomes False. 
+
+    Attributes
+    ----------
+    blocked: np.ndarray
+        boolean mask of the seats that would violate the threshold for a new group
+    violation_free: bool
+        False once a group had to be placed on blocked seats
+    """
+
+    def solve_iter(self, order='descending', threshold=1.5):
+        """
+        Function that solves the seating by greedily picking the best unblocked location
+        for a given group. 
+        """
+        self._start(threshold)
+        groupid = 1
+
+        while not self.attendees.check_complete():
+            # pop a group
+            if order == 'descending':
+                curr = self.attendees.pop_largest()
+            elif order == 'ascending':
+                curr = self.attendees.pop_smallest()
+            elif order == 'random':
+                curr = self.attendees.pop_random()
+
+            coords, metrics = self._place(curr, groupid)
+            yield groupid, curr, coords, metrics
+            groupid += 1
+
+    def _start(self, threshold):
+        """
+        Builds the blocked mask and dist_map for the groups already in the seating
+        """
+        self.scale = get_seat_scale(self.seating)
+        self.stencil = disk_stencil(threshold, self.scale)
+        self.violation_free = True
+
+        # seats that are already filled block their surroundings too
+        self.blocked = np.zeros(self.seating.seating.shape, dtype=bool)
+        for x, y in zip(*np.where(self.seating.seating > 0)):
+            stamp(self.blocked, x, y, self.stencil)
+
+        self._init_distmap()
+        if (self.seating.seating > 0).any():
+            _ = self._update_distmap()
+
+    def _place(self, group, groupid):
+        """
+        Seats a group of size group at its best position, blocks the seats around it and 
+        updates the distances. Returns its coords and metrics
+        """
+        coords = self._best_placement(group, groupid)
+        self.seating.add_many(coords, groupid)
+        metrics = self._metrics(coords)
+        metrics['violation_free'] = self.violation_free
+
+        # block the seats around the group, and update the distances to the new seats
+        for x, y in coords:
+            stamp(self.blocked, x, y, self.stencil)
+        _ = self._update_distmap_near(coords)
+        return coords, metrics
+
+    def can_place(self, group):
+        """
+        Returns True if a group of size group can still be placed without violating the threshold
+        """
+        available = (self.seating.seating == 0) & ~self.blocked
+        for footprint in FOOTPRINTS[group]:
+            if footprint_starts(available, footprint).any():
+                return True
+        return False
+
+    def _best_placement(self, group, groupid):
+        """
+        Returns the coordinates of the best position for a group of size group, preferring
+        positions where no seat is blocked
+        """
+        free = self.seating.seating == 0
+        # However if we are placing the first group, we will pick the set of
+        # valid coordinates, which are as close to 0, 0 as possible
+        corner = self._corner_first(groupid)
+        coords = self._best_candidate(group, free & ~self.blocked, corner)
+        if coords is None:
+            # no violation-free placement is left, fall back to any free position
+            self.violation_free = False
+            coords = self._best_candidate(group, free, corner)
+            if coords is None:
+                raise RuntimeError('no room left for a group of {}'.format(group))
+        return coords
+
+    def _best_candidate(self, group, mask, corner=False):
+        """
+        Returns the coords of the valid position of a group of size group on the seats in mask 
+        with the greatest distance score (or the smallest sum of coordinates if corner), or None 
+        if there is no valid position. Each footprint is reduced to its best position with a 
+        masked argmax, and only the winner's coords are built. Ties go to the first footprint,
+        then to the first position in row-major order
+        """
+        best, best_value = None, None
+        if not corner:
+            score_map = self._score_map()
+        else:
+            xs, ys = np.indices(self.seating.seating.shape)
+        for footprint in FOOTPRINTS[group]:
+            starts = footprint_starts(mask, footprint)
+            if not starts.any():
+                continue
+            if corner:
+                # sum of the coordinates of every seat of the footprint, negated to maximize it
+                values = -(len(footprint) * (xs + ys) + sum(dx + dy for dx, dy in footprint))
+            else:
+                values = footprint_sums(score_map, footprint)
+            idx = np.argmax(np.where(starts, values, -np.inf))
+            value = values.flat[idx]
+            if best_value is None or value > best_value:
+                x, y = np.unravel_index(idx, starts.shape)
+                best, best_value = [(x + dx, y + dy) for dx, dy in footprint], value
+        return best
+
+
+class _BeamState():
+    """
+    One partial seating of a BeamSolver: the mask of free seats, the distance from every seat
+    to the nearest occupied seat, the cumulative score, a hash of the occupied seats and the
+    placements so far as a linked tuple (previous placements, coords), so that branching never
+    copies the history
+    """
+    __slots__ = ('free', 'dist', 'seated', 'score', 'key', 'history')
+
+    def __init__(self, free, dist, seated, score, key, history):
+        self.free = free
+        self.dist = dist
+        self.seated = seated
+        self.score = score
+        self.key = key
+        self.history = history
+
+    def placements(self):
+        """
+        returns the coords of every placement, in the order they were made
+        """
+        placements = []
+        history = self.history
+        while history is not None:
+            history, coords = history
+            placements.append(coords)
+        return placements[::-1]
+
+
+class BeamSolver(ExhaustiveGreedySolver):
+    """
+    A solver that looks further ahead than ExhaustiveGreedySolver by keeping the beam_width
+    best partial seatings after each group, instead of only the best one. Every partial seating
+    is scored by the sum of the dist_map scores of the positions its groups were placed at, the
+    objective ExhaustiveGreedySolver maximizes one group at a time, so beam_width=1 is greedy. 
+
+    Partial seatings are kept as numpy masks and distance maps rather than copies of the
+    seating. All candidate positions of all partial seatings are scored with footprint masks,
+    and only the beam_width chosen ones are branched, by copying two arrays and lowering the
+    distances around the new seats, so the cost grows linearly with beam_width. Partial
+    seatings that fill the same seats are only kept once. The best one is applied to the 
+    seating at the end. 
+
+    Attributes
+    ----------
+    score: float
+        cumulative score of the seating that was chosen
+    """
+
+    def solve_iter(self, order='descending', beam_width=4):
+        """
+        Function that solves the seating with a beam search over the positions of the groups. 
+        No group is seated before the search has placed every group, then the groups of the
+        best partial seating are seated and yielded in order
+        """
+        self.scale = get_seat_scale(self.seating)
+        layers = self._layer_map()
+
+        self._init_distmap()
+        seated = (self.seating.seating > 0).any()
+        if seated:
+            _ = self._update_distmap()
+
+        # random bits for every seat, the key of a partial seating is the xor over its occupied seats
+        zobrist = np.random.RandomState(0).randint(0, 2 ** 62, size=self.dist_map.shape, dtype=np.int64)
+        self._xs, self._ys = np.indices(self.dist_map.shape)
+
+        # the groups are seated in the same order in every partial seating
+        groups = []
+        while not self.attendees.check_complete():
+            if order == 'descending':
+                groups.append(self.attendees.pop_largest())
+            elif order == 'ascending':
+                groups.append(self.attendees.pop_smallest())
+            elif order == 'random':
+                groups.append(self.attendees.pop_random())
+
+        beam = [_BeamState(self.seating.seating == 0, self.dist_map.copy(), seated, 0.0, 0, None)]
+        for groupid, curr in enumerate(groups, start=1):
+            beam = self._expand(beam, curr, groupid, beam_width, layers, zobrist)
+
+        # seat everyone as in the best partial seating
+        best = beam[0]
+        self.score = best.score
+        free = best.free
+        self.dist_map[free] = best.dist[free]
+        for groupid, coords in enumerate(best.placements(), start=1):
+            self.seating.add_many(coords, groupid)
+            yield groupid, len(coords), coords, BaseSolver._metrics(self, coords)
+
+    def _expand(self, beam, group, groupid, beam_width, layers, zobrist):
+        """
+        Returns the beam_width best partial seatings that place a group of size group in one of
+        the partial seatings in beam
+        """
+        candidates = [] # arrays of (state, footprint, x, y, cumulative score, corner distance, key)
+        for s, state in enumerate(beam):
+            score_map = state.dist if layers is None else state.dist + layers
+            for i, footprint in enumerate(FOOTPRINTS[group]):
+                xs, ys = np.where(footprint_starts(state.free, footprint))
+                if len(xs) == 0:
+                    continue
+                scores = state.score + footprint_sums(score_map, footprint)[xs, ys]
+                corner = len(footprint) * (xs + ys) + sum(dx + dy for dx, dy in footprint)
+                keys = np.full(len(xs), state.key, dtype=np.int64)
+                for dx, dy in footprint:
+                    keys ^= zobrist[xs + dx, ys + dy]
+                candidates.append((np.full(len(xs), s), np.full(len(xs), i), xs, ys, scores, corner, keys))
+
+        if len(candidates) == 0:
+            raise RuntimeError('no room left for a group of {}'.format(group))
+        states, footprints, xs, ys, scores, corner, keys = [np.concatenate(column) for column in zip(*candidates)]
+
+        # rank by score, then closeness to 0, 0. The first group goes as close to 0, 0 as 
+        # possible, as in ExhaustiveGreedySolver
+        if self._corner_first(groupid):
+            ranking = np.lexsort((-scores, corner))
+        else:
+            ranking = np.lexsort((corner, -scores))
+
+        new_beam = []
+        seen = set()
+        for c in ranking:
+            if keys[c] in seen:
+                continue
+            seen.add(keys[c])
+            footprint = FOOTPRINTS[group][footprints[c]]
+            coords = [(int(xs[c]) + dx, int(ys[c]) + dy) for dx, dy in footprint]
+            new_beam.append(self._branch(beam[states[c]], coords, scores[c], keys[c]))
+            if len(new_beam) == beam_width:
+                break
+        return new_beam
+
+    def _branch(self, state, coords, score, key):
+        """
+        Returns a new partial seating with the seats in coords filled
+        """
+        free = state.free.copy()
+        for x, y in coords:
+            free[x, y] = False
+
+        new = np.min([np.sqrt(((self._xs - x) * self.scale[0]) ** 2 + ((self._ys - y) * self.scale[1]) ** 2)
+                      for x, y in coords], axis=0)
+        # the first occupied seats have no previous distance to compare to
+        dist = np.minimum(state.dist, new) if state.seated else new
+        dist = dist.astype(state.dist.dtype, copy=False)
+        return _BeamState(free, dist, True, score, key, (state.history, coords))
+
+
+def _portfolio_run(venue, layers, compact, attendees, solver_cls, kwargs, seed, threshold, metric, layer_weights):
+    """
+    Runs one PortfolioSolver configuration, in a worker process, on a SharedSeating of the shared
+    venue. Returns the seats it filled ({(x, y) -> groupid}), its metric and its number of threshold
+    violations, or None if the solver could not place everyone
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    seating = SharedSeating(venue)
+    seating.layers = layers
+    if compact:
+        seating.compact()
+    try:
+        solver_cls(seating, attendees, layer_weights).solve(**kwargs)
+    except (RuntimeError, ValueError):
+        return None
+    return seating.occupancy, metric(seating), evaluate_closerthan_thresh(seating, threshold, reduce_='sum')
+
+
+class PortfolioSolver(BaseSolver):
+    """
+    A solver that races several solver configurations, plus random-order restarts, in worker
+    processes under a wall-clock deadline, and seats the attendees as in the best result. 
+
+    Results are ranked first by whether they are violation-free for the threshold, then by the
+    metric (higher is better). By default the remaining runs are cancelled as soon as one
+    violation-free result comes in. The runs attach to a copy of the venue in shared memory
+    (see SharedVenue) and only send back the seats they filled. 
+
+    Attributes
+    ----------
+    results: list[tuple(str, float, int)]
+        description, metric and number of threshold violations of every finished run
+    errors: list[tuple(str, Exception)]
+        description and exception of every run that failed with an unexpected error
+    best_config: str
+        description of the run whose seating was used
+    """
+
+    def solve_iter(self, configs=None, restarts=4, deadline=60, threshold=1.5, metric=evaluate_nearest_distance,
+                   processes=None, stop_on_feasible=True):
+        """
+        Solves by running every configuration in a process pool, until all have finished, the
+        deadline (in seconds) has passed, or (if stop_on_feasible) a violation-free seating is found.
+
+        configs is a list of (solver class, solve() keyword arguments). By default it holds the
+        exhaustive, lazy, priority and threshold solvers in descending order, the exhaustive solver
+        in ascending order, and the naive solver. restarts random-order LazyGreedySolver runs are
+        added to the configs. metric must be a picklable function of a solved seating. 
+
+        The attendees are only consumed as the groups of the best seating are applied. If no run
+        produced a seating, a RuntimeError is raised, chained to the first unexpected worker error
+        if there was one. 
+        """
+        if configs is None:
+            configs = [
+                (ExhaustiveGreedySolver, {'order': 'descending'}),
+                (ExhaustiveGreedySolver, {'order': 'ascending'}),
+                (LazyGreedySolver, {'order': 'descending'}),
+                (PrioritySolver, {'order': 'descending'}),
+                (ThresholdSolver, {'order': 'descending', 'threshold': threshold}),
+                (NaiveSolver, {})
+            ]
+        configs = list(configs) + [(LazyGreedySolver, {'order': 'random'})] * restarts
+
+        # every run gets its own copy of the attendees, the attendees here are consumed once
+        # the best seating is applied
+        attendees = copy.deepcopy(self.attendees)
+
+        # the runs attach to the venue in shared memory instead of each unpickling a copy of the seating
+        venue = self.seating.to_shared()
+        compact = self.seating.distance_dtype == np.float32
+
+        finished = queue.Queue()
+        pool = Pool(processes)
+        self.results = []
+        self.errors = []
+        timed_out = False
+        best, best_key = None, None
+        stop_at = time.time() + deadline
+        try:
+            for i, (solver_cls, kwargs) in enumerate(configs):
+                description = '{}({})'.format(solver_cls.__name__, kwargs)
+                pool.apply_async(_portfolio_run,
+                                 (venue, self.seating.layers, compact, attendees, solver_cls, kwargs,
+                                  int(np.random.randint(2 ** 31, dtype=np.int64)), threshold, metric, 
+                                  self.layer_weights),
+                                 callback=lambda result, description=description: finished.put((description, result, None)),
+                                 error_callback=lambda error, description=description: finished.put((description, None, error)))
+
+            for _ in range(len(configs)):
+                # wait for the next run to finish, until the deadline
+                try:
+                    description, result, error = finished.get(timeout=max(0, stop_at - time.time()))
+                except queue.Empty:
+                    timed_out = True
+                    break
+                if error is not None:
+                    self.errors.append((description, error))
+                    continue
+                if result is None:
+                    continue
+
+                occupancy, score, violations = result
+                self.results.append((description, score, violations))
+                key = (violations == 0, score)
+                if best_key is None or key > best_key:
+                    best, best_key = (description, occupancy), key
+
+                if stop_on_feasible and violations == 0:
+                    break
+        finally:
+            # cancels the runs that are still going
+            pool.terminate()
+            pool.join()
+            venue.unlink()
+
+        if best is None:
+            if len(self.errors) > 0:
+                description, error = self.errors[0]
+                raise RuntimeError('{} of {} configurations failed with an error, first {}: {!r}'.format(
+                    len(self.errors), len(configs), description, error)) from error
+            if timed_out:
+                raise RuntimeError('no configuration finished before the deadline')
+            raise RuntimeError('no configuration could seat every group')
+
+        # seat everyone as in the best run, one group at a time
+        self.best_config, occupancy = best
+        groups = {}
+        for (x, y), groupid in sorted(occupancy.items()):
+            groups.setdefault(int(groupid), []).append((int(x), int(y)))
+        for groupid in sorted(groups):
+            coords = groups[groupid]
+            self.seating.add_many(coords, groupid)
+            self.attendees.groups.remove(len(coords))
+            yield groupid, len(coords), coords, self._metrics(coords)
+
+
+class TilingSolver(BaseSolver):
+    """
+    A solver for venues made of identical blocks separated by aisles, such as the seatings
+    from BaseSeating.from_regular_blocks. 
+
+    Every block gets room for the same mix of groups: for each group size, the number of groups
+    divided by the number of blocks, rounded up. That mix is solved once on a single block and
+    the solution is stamped onto the blocks in turn, until the groups of each size run out, so
+    the last blocks may be left with empty slots. A stamped group that would come within 
+    threshold of a group already placed (e.g. in a neighbouring block) is left out. The groups 
+    left over (any that did not fit in the block and any left out) are then placed on the whole 
+    venue by ThresholdSolver, which keeps clear of every group already placed while it can. 
+    Venues without a repeated block structure are solved by the block solver directly. 
+
+    Attributes
+    ----------
+    tiles: list[tuple(x, y)]
+        upper left corners of the blocks, or None if no block structure was found
+    block_shape: tuple(int, int)
+        shape of each block
+    """
+
+    def solve_iter(self, order='descending', block_solver=None, threshold=1.5):
+        """
+        Solves by stamping the solution of one block onto every block, then placing the
+        leftover groups. block_solver is the solver class used on the block (by default
+        ExhaustiveGreedySolver). order is passed to its solve() and used for the leftovers
+        """
+        if block_solver is None:
+            block_solver = ExhaustiveGreedySolver
+        self.tiles, self.block_shape = self._find_tiles()
+        if self.tiles is None:
+            yield from block_solver(self.seating, self.attendees, self.layer_weights).solve_iter(order=order)
+            return
+
+        # every tile has room for counts[size] / n_tiles groups of each size, rounded up
+        n_tiles = len(self.tiles)
+        counts = Counter(self.attendees.groups)
+        per_tile = {size: -(-count // n_tiles) for size, count in counts.items()}
+        placements = self._solve_block(per_tile, order, block_solver)
+
+        # stamp the block solution onto every tile, keeping the scaled coords of the occupied
+        # seats so stamped groups report their distance like the leftovers do
+        self.scale = np.array(get_seat_scale(self.seating), dtype=float)
+        self._occupied = np.empty((self.seating.totalseats, 2))
+        seated = np.argwhere(self.seating.seating > 0) * self.scale
+        self._occupied[:len(seated)] = seated
+        self._n_occupied = len(seated)
+
+        # seats within threshold of a placed group, so groups near other blocks are not stamped
+        stencil = disk_stencil(threshold, tuple(self.scale))
+        blocked = np.zeros(self.seating.seating.shape, dtype=bool)
+        for x, y in zip(*np.where(self.seating.seating > 0)):
+            stamp(blocked, x, y, stencil)
+
+        groupid = 1
+        for x0, y0 in self.tiles:
+            for coords in placements:
+                stamped = [(x0 + x, y0 + y) for x, y in coords]
+                if counts[len(stamped)] == 0 or any(blocked[x, y] for x, y in stamped):
+                    continue
+                self.seating.add_many(stamped, groupid)
+                for x, y in stamped:
+                    stamp(blocked, x, y, stencil)
+                counts[len(stamped)] -= 1
+                yield groupid, len(stamped), stamped, self._metrics(stamped)
+                groupid += 1
+
+        # whatever was not stamped is placed on the whole venue
+        self.attendees.groups = []
+        yield from self._place_leftovers(counts, groupid, order, threshold)
+
+    def _metrics(self, coords):
+        """
+        Returns the metrics of a stamped group, the same as those of the leftover groups: the
+        distance from the group to the nearest seat occupied before it (nan for the first 
+        group) and the number of unfilled seats
+        """
+        new = np.array(coords, dtype=float) * self.scale
+        occupied = self._occupied[:self._n_occupied]
+        distance = np.nan
+        if len(occupied) > 0:
+            distance = float(np.sqrt(((occupied[:, None, :] - new[None, :, :]) ** 2).sum(axis=2)).min())
+        self._occupied[self._n_occupied : self._n_occupied + len(new)] = new
+        self._n_occupied += len(new)
+        return {'distance': distance, 'unfilledseats': int(self.seating.unfilledseats)}
+
+    def _find_tiles(self):
+        """
+        Splits the seating along the rows and columns that are entirely aisle, and returns the
+        upper left corners of the pieces and their shape if all pieces are identical, or
+        (None, None) otherwise
+        """
+        grid = self.seating.seating
+
+        def segments(is_aisle):
+            # (start, length) of every run of lines that are not entirely aisle
+            edges = np.diff(np.concatenate(([0], (~is_aisle).astype(np.int8), [0])))
+            return list(zip(np.where(edges == 1)[0].tolist(), 
+                            (np.where(edges == -1)[0] - np.where(edges == 1)[0]).tolist()))
+
+        xsegs = segments((grid == -1).all(axis=1))
+        ysegs = segments((grid == -1).all(axis=0))
+        if len(xsegs) * len(ysegs) < 2:
+            return None, None
+        if len(set(length for _, length in xsegs)) > 1 or len(set(length for _, length in ysegs)) > 1:
+            return None, None
+
+        shape = (xsegs[0][1], ysegs[0][1])
+        tiles = [(x0, y0) for x0, _ in xsegs for y0, _ in ysegs]
+
+        # the blocks, and the weighted risk layers on them, must all be the same
+        maps = [grid]
+        if self._layer_map() is not None:
+            maps.append(self._layer_map())
+        for values in maps:
+            block = values[tiles[0][0] : tiles[0][0] + shape[0], tiles[0][1] : tiles[0][1] + shape[1]]
+            for x0, y0 in tiles:
+                if not np.array_equal(values[x0 : x0 + shape[0], y0 : y0 + shape[1]], block):
+                    return None, None
+        return tiles, shape
+
+    def _solve_block(self, per_tile, order, block_solver):
+        """
+        Solves the mix of groups per_tile {size -> number of groups} on one block and returns 
+        the coords of each placed group, relative to the block. If the mix does not fit, the 
+        smallest group is dropped from it until it does
+        """
+        x0, y0 = self.tiles[0]
+        block = self.seating.seating[x0 : x0 + self.block_shape[0], y0 : y0 + self.block_shape[1]]
+        groups = sorted(size for size, count in per_tile.items() for _ in range(count))
+
+        while len(groups) > 0:
+            # keep the seat dimensions, so distances on the block match the venue
+            if 'seatlen' in self.seating.__dict__.keys():
+                block_seating = LengthWidthSeating(int((block == 0).sum()), np.array(block), 
+                                                   self.seating.seatlen, self.seating.seatwidth)
+            else:
+                block_seating = BaseSeating(int((block == 0).sum()), np.array(block))
+            block_seating.distance_dtype = self.seating.distance_dtype
+            for name in self.layer_weights:
+                block_seating.add_layer(name, self.seating.layers[name][x0 : x0 + self.block_shape[0], 
+                                                                       y0 : y0 + self.block_shape[1]])
+            try:
+                block_solver(block_seating, BaseAttendees(list(groups), 'tile'), 
+                             self.layer_weights).solve(order=order)
+            except (RuntimeError, ValueError):
+                groups.pop(0)
+                continue
+
+            # read the placed groups back from the block grid, in the order they were seated
+            placements = []
+            for groupid in range(1, len(groups) + 1):
+                xs, ys = np.where(block_seating.seating == groupid)
+                placements.append(list(zip(xs.tolist(), ys.tolist())))
+            return placements
+        return []
+
+    def _place_leftovers(self, counts, groupid, order, threshold):
+        """
+        Places counts {size -> number of groups} on the whole seating in the given order with
+        ThresholdSolver, with group ids starting at groupid, yielding each group like solve_iter()
+        """
+        attendees = BaseAttendees.from_custom({size: count for size, count in counts.items() if count > 0})
+        solver = ThresholdSolver(self.seating, attendees, self.layer_weights)
+        solver._start(threshold)
+        while not attendees.check_complete():
+            if order == 'descending':
+                curr = attendees.pop_largest()
+            elif order == 'ascending':
+                curr = attendees.pop_smallest()
+            elif order == 'random':
+                curr = attendees.pop_random()
+            coords, _ = solver._place(curr, groupid)
+            yield groupid, curr, coords, self._metrics(coords)
+            groupid += 1
+
+
+# solver configurations AutoSolver chooses from: name -> (solver class, distmap backend, solve() kwargs)
+AUTO_CONFIGS = {
+    'exhaustive-edt': (ExhaustiveGreedySolver, 'edt', {}),
+    'exhaustive-pdist': (ExhaustiveGreedySolver, 'pdist', {}),
+    'lazy-edt': (LazyGreedySolver, 'edt', {}),
+    'priority-edt': (PrioritySolver, 'edt', {}),
+    'priority-pdist': (PrioritySolver, 'pdist', {}),
+    'threshold': (ThresholdSolver, 'edt', {}),
+    'beam-4': (BeamSolver, 'edt', {'beam_width': 4}),
+    'naive': (NaiveSolver, None, {})
+}
+
+# the pdist backend needs memory quadratic in the number of seats, so it is only timed on small venues
+CALIBRATION_MAX_SEATS = {'pdist': 400}
+
+
+def _make_solver(config, seating, attendees, layer_weights=None):
+    """
+    Returns the solver for an AUTO_CONFIGS entry, and the keyword arguments for its solve()
+    """
+    solver_cls, backend, kwargs = AUTO_CONFIGS[config]
+    solver = solver_cls(seating, attendees, layer_weights)
+    if backend is not None:
+        solver.distmap_backend = backend
+    return solver, dict(kwargs)
+
+def _cost_features(seating: BaseSeating, n_groups):
+    """
+    Returns the features of the cost model: 1, log(number of empty seats), log(number of groups)
+    """
+    return np.array([1.0, np.log(max(seating.unfilledseats, 1)), np.log(max(n_groups, 1))])
+
+def calibrate(path='saved/calibration.json', tilings=((1, 1), (2, 2), (4, 4)), occupancies=(0.15, 0.3),
+              attendee_dist=None, configs=None, verbose=True):
+    """
+    Runs a short benchmark of every configuration in AUTO_CONFIGS on venues of 10x10 blocks with
+    the given tilings, at the given fractions of seats sold, and writes the fitted cost model to
+    path as json. Attendees are drawn from attendee_dist, by default {1: 1, 2: 2, 3: 2, 4: 1}. 
+
+    For every configuration, the time of a solve is modelled as 
+        log(time) = a + b * log(empty seats) + c * log(groups)
+    fitted by least squares, and its quality is the mean ratio of its average nearest distance
+    (evaluate_nearest_distance) to the best one among the configurations on the same instance. 
+    Configurations whose backend is limited by CALIBRATION_MAX_SEATS record that limit as 
+    max_seats, since the model was not fitted beyond it. Instances on which every configuration
+    failed or was skipped are left out. Returns the calibration dict, or raises RuntimeError if no
+    configuration could be timed at all
+    """
+    if attendee_dist is None:
+        attendee_dist = {1: 1, 2: 2, 3: 2, 4: 1}
+    configs = list(AUTO_CONFIGS) if configs is None else list(configs)
+    features = {config: [] for config in configs}
+    times = {config: [] for config in configs}
+    ratios = {config: [] for config in configs}
+
+    for tiling in tilings:
+        venue = BaseSeating.from_regular_blocks((10, 10), tiling)
+        for occupancy in occupancies:
+            attendees = BaseAttendees.from_probs(attendee_dist, int(venue.totalseats * occupancy))
+            scores = {}
+            for config in configs:
+                backend = AUTO_CONFIGS[config][1]
+                if venue.totalseats > CALIBRATION_MAX_SEATS.get(backend, np.inf):
+                    continue
+                seating = copy.deepcopy(venue)
+                solver, kwargs = _make_solver(config, seating, copy.deepcopy(attendees))
+                start = time.time()
+                try:
+                    solver.solve(**kwargs)
+                except (RuntimeError, ValueError):
+                    continue
+                features[config].append(_cost_features(venue, len(attendees.groups)))
+                times[config].append(max(time.time() - start, 1e-6))
+                scores[config] = evaluate_nearest_distance(seating)
+
+            if len(scores) == 0:
+                continue # every configuration failed or was skipped on this instance
+            best = max(scores.values())
+            for config, score in scores.items():
+                ratios[config].append(score / best)
+            if verbose:
+                print('{} seats, {} groups: {}'.format(venue.totalseats, len(attendees.groups), 
+                      ', '.join('{} {:.3f}s'.format(config, times[config][-1]) for config in scores)))
+
+    if not any(times.values()):
+        raise RuntimeError('none of the configurations {} could be calibrated'.format(configs))
+    calibration = {'version': 1, 'configs': {}}
+    for config in configs:
+        if len(times[config]) == 0:
+            continue
+        X = np.array(features[config])
+        # with too few distinct venues for the full model, only fit the intercept
+        if np.linalg.matrix_rank(X) < X.shape[1]:
+            coef = [float(np.mean(np.log(times[config]))), 0.0, 0.0]
+        else:
+            coef = np.linalg.lstsq(X, np.log(times[config]), rcond=None)[0].tolist()
+        calibration['configs'][config] = {'coef': coef, 'quality': float(np.mean(ratios[config])), 
+                                          'max_seats': CALIBRATION_MAX_SEATS.get(AUTO_CONFIGS[config][1])}
+
+    if path is not None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(calibration, f, indent=2)
+    return calibration
+
+def predict_costs(calibration, seating: BaseSeating, n_groups):
+    """
+    Returns {config -> predicted seconds to seat n_groups groups on seating} from a calibration
+    """
+    x = _cost_features(seating, n_groups)
+    return {config: float(np.exp(x @ np.array(entry['coef']))) 
+            for config, entry in calibration['configs'].items()}
+
+def choose_config(calibration, seating: BaseSeating, n_groups, time_budget=None, min_quality=0.95):
+    """
+    Returns the configuration to use for seating n_groups groups: the one with the best calibrated 
+    quality among those predicted to finish within time_budget seconds, considering only those with
+    quality of at least min_quality if any. If no configuration fits the time budget, the fastest 
+    one meeting the quality target is used. Configurations calibrated only up to fewer seats than
+    the venue has (max_seats) are not considered
+    """
+    def covers(config):
+        # calibrations saved before max_seats was recorded fall back to the current limits
+        max_seats = calibration['configs'][config].get('max_seats', 
+                                                       CALIBRATION_MAX_SEATS.get(AUTO_CONFIGS[config][1]))
+        return max_seats is None or seating.totalseats <= max_seats
+
+    costs = predict_costs(calibration, seating, n_groups)
+    costs = {config: cost for config, cost in costs.items() if covers(config)} or costs
+    quality = {config: entry['quality'] for config, entry in calibration['configs'].items()}
+    good = [config for config in costs if quality[config] >= min_quality] or list(costs)
+    in_time = [config for config in good if time_budget is None or costs[config] <= time_budget]
+    if len(in_time) == 0:
+        return min(good, key=lambda config: costs[config])
+    # prefer quality, then speed
+    return max(in_time, key=lambda config: (quality[config], -costs[config]))
+
+
+class AutoSolver(BaseSolver):
+    """
+    A solver that picks the solver and distance map backend for each venue from a cost model
+    calibrated on this machine (see calibrate), and solves with it. The calibration is read from
+    a json file written by calibrate(), which must be run first since it takes a while. 
+
+    Attributes
+    ----------
+    config: str
+        name of the AUTO_CONFIGS entry that was used
+    predicted_cost: float
+        predicted time of the solve in seconds
+    """
+
+    def solve_iter(self, time_budget=None, min_quality=0.95, calibration='saved/calibration.json'):
+        """
+        Solves with the configuration chosen by choose_config for the time budget (seconds) and
+        minimum quality (ratio to the best calibrated average nearest distance). calibration is a
+        path or a calibration dict
+        """
+        if isinstance(calibration, str):
+            if not os.path.exists(calibration):
+                raise FileNotFoundError('no calibration at {}, run calibrate({!r}) first'.format(calibration, 
+                                                                                               calibration))
+            with open(calibration) as f:
+                calibration = json.load(f)
+
+        n_groups = len(self.attendees.groups)
+        self.config = choose_config(calibration, self.seating, n_groups, time_budget, min_quality)
+        self.predicted_cost = predict_costs(calibration, self.seating, n_groups)[self.config]
+        solver, kwargs = _make_solver(self.config, self.seating, self.attendees, self.layer_weights)
+        yield from solver.solve_iter(**kwargs)
@@ -0,0 +1,67 @@
+import numpy as np
+import copy
+import time
+import tracemalloc
+from Seating import BaseSeating
+from Attendees import BaseAttendees
+from Solvers import ExhaustiveGreedySolver, LazyGreedySolver, BeamSolver
+from evaluate import evaluate_nearest_distance, evaluate_closerthan_thresh
+
+"""
+Compares the peak memory of the default and compact memory modes (BaseSeating.compact) for
+building a venue, solving it and evaluating the solution, and compares the seatings and metrics
+of both modes. The solvers keep float64 distance maps in both modes, so the seatings are the 
+same and the metrics only differ up to the float32 precision of the evaluation matrices. Run 
+with python bench_memory.py
+"""
+
+def peak_memory(function):
+    """
+    Runs function and returns its result, its peak traced memory in MB and its time in seconds
+    """
+    tracemalloc.start()
+    start = time.time()
+    result = function()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 2 ** 20, elapsed
+
+def run(tiling, compact, solver_cls, n_attendees):
+    """
+    Benchmarks one venue of 10x10 blocks in one memory mode, returns the solved grid, 
+    the metrics and a dict of (peak MB, seconds) per step
+    """
+    steps = {}
+    venue, peak, elapsed = peak_memory(lambda: BaseSeating.from_regular_blocks((10, 10), tiling, compact=compact))
+    steps['build'] = (peak, elapsed)
+
+    np.random.seed(0)
+    attendees = BaseAttendees.from_probs({1: 1, 2: 2, 3: 2, 4: 1}, n_attendees)
+    seating = copy.deepcopy(venue)
+    solver = solver_cls(seating, attendees)
+    _, peak, elapsed = peak_memory(solver.solve)
+    steps['solve'] = (peak, elapsed)
+    steps['dist_map'] = (solver.dist_map.nbytes / 2 ** 20, 0)
+    steps['grid'] = (seating.seating.nbytes / 2 ** 20, 0)
+
+    metrics, peak, elapsed = peak_memory(lambda: (evaluate_nearest_distance(seating), 
+                                                  evaluate_closerthan_thresh(seating, 1.5, reduce_='sum')))
+    steps['evaluate'] = (peak, elapsed)
+    return seating.seating, metrics, steps
+
+if __name__ == '__main__':
+    for tiling, solver_cls, n_attendees in [((5, 5), ExhaustiveGreedySolver, 800), 
+                                            ((5, 5), LazyGreedySolver, 800),
+                                            ((5, 5), BeamSolver, 800),
+                                            ((7, 7), ExhaustiveGreedySolver, 1500)]:
+        grid, metrics, default = run(tiling, False, solver_cls, n_attendees)
+        compact_grid, compact_metrics, compact = run(tiling, True, solver_cls, n_attendees)
+
+        print('{} seats, {} attendees, {}'.format(100 * tiling[0] * tiling[1], n_attendees, solver_cls.__name__))
+        print('    {:<10}{:>14}{:>14}{:>10}'.format('step', 'default MB', 'compact MB', 'ratio'))
+        for step in default:
+            print('    {:<10}{:>14.2f}{:>14.2f}{:>10.2f}'.format(step, default[step][0], compact[step][0], 
+                                                             compact[step][0] / max(default[step][0], 1e-9)))
+        print('    seats placed differently: {}, metrics: default {}, compact {}'.format(
+            int(((grid > 0) != (compact_grid > 0)).sum()), np.round(metrics, 6), np.round(compact_metrics, 6)))
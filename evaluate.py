@@ -1,7 +1,7 @@
 import numpy as np
 from Seating import BaseSeating
+from utils import get_seat_scale
 from scipy.spatial.distance import pdist, squareform
-import copy
 
 """
 Functions for evaluation of solved seatings
@@ -20,13 +20,18 @@ def get_occupied_seats(seating: BaseSeating):
 def get_dmat_seats(occupied_seats, seating):
     """
     Returns a square pairwise euclidean distance matrix between all occupied seats
-    Can take into account non-unit seat dimensions
+    Can take into account non-unit seat dimensions. The matrix has the seating's distance_dtype
     """
-    adjusted_seats = copy.copy(occupied_seats)
+    # float, so scaling by non-unit seat dimensions does not truncate the coordinates
+    adjusted_seats = occupied_seats.astype(np.float64)
     if 'seatlen' in seating.__dict__.keys():
         adjusted_seats[:, 0] = adjusted_seats[:, 0] * seating.seatwidth
         adjusted_seats[:, 1] = adjusted_seats[:, 1] * seating.seatlen
-    return squareform(pdist(adjusted_seats))
+    distances = pdist(adjusted_seats)
+    if seating.distance_dtype != np.float64:
+        # convert the condensed distances, so the square matrix is never built in float64
+        distances = distances.astype(seating.distance_dtype)
+    return squareform(distances)
 
 def evaluate_nearest_distance(seating: BaseSeating):
     """
@@ -60,7 +65,7 @@ def evaluate_nearest_distance(seating: BaseSeating):
             distances.append(row[rank])
             break
     
-    return np.mean(distances)
+    return np.mean(distances, dtype=np.float64)
 
 
 def evaluate_closerthan_thresh(seating: BaseSeating, threshold, reduce_='mean'):
@@ -120,7 +125,225 @@ def evaluate_closerthan_thresh(seating: BaseSeating, threshold, reduce_='mean'):
         else:
             return False   
 
+def get_offsets(shape, scale, max_dist=None):
+    """
+    Returns all nonzero (dx, dy) grid offsets that fit in a grid of the given shape, and their
+    distances, sorted by increasing distance. If max_dist is given, only offsets at most
+    max_dist away are returned. 
+    """
+    dx, dy = np.meshgrid(np.arange(-(shape[0] - 1), shape[0]), np.arange(-(shape[1] - 1), shape[1]),
+                         indexing='ij')
+    dx, dy = dx.ravel(), dy.ravel()
+    dists = np.sqrt((dx * scale[0]) ** 2 + (dy * scale[1]) ** 2)
+
+    keep = dists > 0 # drop the (0, 0) offset
+    if max_dist is not None:
+        keep &= dists <= max_dist
+
+    order = np.argsort(dists[keep], kind='stable')
+    return dx[keep][order], dy[keep][order], dists[keep][order]
+
+def _shifted(grids, dx, dy):
+    """
+    Returns the slices (here, there) of the last two axes such that grids[..., there] holds the
+    seat at offset (dx, dy) from the seat at the same position in grids[..., here]
+    """
+    xdim, ydim = grids.shape[-2], grids.shape[-1]
+    here = (Ellipsis, slice(max(0, -dx), xdim - max(0, dx)), slice(max(0, -dy), ydim - max(0, dy)))
+    there = (Ellipsis, slice(max(0, dx), xdim - max(0, -dx)), slice(max(0, dy), ydim - max(0, -dy)))
+    return here, there
+
+def per_seat_violations(grids, seating: BaseSeating, threshold):
+    """
+    Takes a stack of solved grids for the same venue, shape (B, X, Y), and returns an int array
+    of the same shape with the number of individuals from other groups within threshold of the
+    person in each seat (0 for seats without a person)
+    """
+    return _per_seat_violations(grids, get_seat_scale(seating), threshold)
+
+def _per_seat_violations(grids, scale, threshold):
+    grids = np.asarray(grids)
+    counts = np.zeros(grids.shape, dtype=np.int32)
+    occupied = grids > 0
+
+    # compare every seat with the seat at each offset within the threshold, for the whole stack at once
+    for dx, dy, _ in zip(*get_offsets(grids.shape[-2:], scale, threshold)):
+        here, there = _shifted(grids, dx, dy)
+        counts[here] += occupied[here] & occupied[there] & (grids[here] != grids[there])
+    return counts
+
+def per_seat_nearest(grids, seating: BaseSeating):
+    """
+    Takes a stack of solved grids for the same venue, shape (B, X, Y), and returns a float array
+    of the same shape with the distance from the person in each seat to the nearest individual
+    from another group (nan for seats without a person, or without anyone from another group)
+    """
+    return _per_seat_nearest(grids, get_seat_scale(seating))
+
+def _per_seat_nearest(grids, scale):
+    grids = np.asarray(grids)
+    nearest = np.full(grids.shape, np.nan)
+    pending = grids > 0 # people whose nearest other-group neighbour is still unknown
+
+    # offsets are visited in increasing distance, so the first hit for each person is the nearest
+    for dx, dy, dist in zip(*get_offsets(grids.shape[-2:], scale)):
+        if not pending.any():
+            break
+        here, there = _shifted(grids, dx, dy)
+        found = pending[here] & (grids[there] > 0) & (grids[here] != grids[there])
+        nearest[here][found] = dist
+        pending[here][found] = False
+    return nearest
+
+def evaluate_nearest_distance_batch(grids, seating: BaseSeating):
+    """
+    Batch version of evaluate_nearest_distance. Takes a stack of solved grids for the same venue
+    as seating, shape (B, X, Y), and returns an array of shape (B,) with the average distance 
+    between each individual and the nearest individual from a different group, for every grid
+    """
+    nearest = per_seat_nearest(grids, seating)
+    found = ~np.isnan(nearest)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(found, nearest, 0).sum(axis=(1, 2)) / found.sum(axis=(1, 2))
+
+def evaluate_closerthan_thresh_batch(grids, seating: BaseSeating, threshold, reduce_='mean'):
+    """
+    Batch version of evaluate_closerthan_thresh. Takes a stack of solved grids for the same venue
+    as seating, shape (B, X, Y), and returns an array of shape (B,) reduced as specified by reduce_
+
+    reduce:
+        'mean' -> returns the average number of threshold violations per individual
+        'sum' -> returns the total number of threshold violations
+        'boolean' -> returns False if the threshold was ever violated, True otherwise
+    """
+    grids = np.asarray(grids)
+    totals = per_seat_violations(grids, seating, threshold).sum(axis=(1, 2))
+    if reduce_ == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return totals / (grids > 0).sum(axis=(1, 2))
+    elif reduce_ == 'sum':
+        return totals
+    elif reduce_ == 'boolean':
+        return totals == 0
+
+
+class SeatingHeatmaps:
+    """
+    A class that accumulates per-seat statistics over many solved seatings of the same venue,
+    such as the bootstrap samples of suggest.is_safe, without storing the seatings. All counts
+    are arrays with the shape of the seating grid that are updated in place, and accumulators
+    from different worker processes can be merged. 
+
+    Attributes
+    ----------
+    samples: int
+        number of seatings accumulated
+    occupied: np.ndarray
+        number of seatings in which each seat was occupied
+    violations: np.ndarray
+        number of seatings in which the person in each seat had someone from another group
+        within threshold
+    nearest_sum, nearest_count: np.ndarray
+        sum and count of the distance from the person in each seat to the nearest individual
+        from another group
+
+    Methods
+    -------
+    update(seating)
+        adds a solved seating (or a grid, or a (B, X, Y) stack of grids) to the counts
     
+    merge(other)
+        adds the counts of another SeatingHeatmaps for the same venue and threshold
+
+    occupancy_rate(), violation_rate(), mean_nearest()
+        return the heatmaps as per-seat frequencies / means (nan where never occupied)
+
+    save(path), load(path)
+        write / read the counts as an .npz file
+    """
+
+    def __init__(self, seating: BaseSeating, threshold):
+        """
+        Creates empty accumulators for seatings of the same venue as seating
+        """
+        self.shape = tuple(np.shape(seating.seating))
+        self.scale = get_seat_scale(seating)
+        self.threshold = threshold
+        self.samples = 0
+        self.occupied = np.zeros(self.shape, dtype=np.int64)
+        self.violations = np.zeros(self.shape, dtype=np.int64)
+        self.nearest_sum = np.zeros(self.shape)
+        self.nearest_count = np.zeros(self.shape, dtype=np.int64)
+
+    def update(self, seating):
+        """
+        adds a solved seating, a grid, or a (B, X, Y) stack of grids to the counts
+        """
+        grids = np.asarray(seating.seating if isinstance(seating, BaseSeating) else seating)
+        if grids.ndim == 2:
+            grids = grids[np.newaxis]
+
+        self.samples += grids.shape[0]
+        self.occupied += (grids > 0).sum(axis=0)
+        self.violations += (_per_seat_violations(grids, self.scale, self.threshold) > 0).sum(axis=0)
+        nearest = _per_seat_nearest(grids, self.scale)
+        found = ~np.isnan(nearest)
+        self.nearest_sum += np.where(found, nearest, 0).sum(axis=0)
+        self.nearest_count += found.sum(axis=0)
+
+    def merge(self, other):
+        """
+        adds the counts of other, which must be for the same venue and threshold
+        """
+        if other.shape != self.shape or other.scale != self.scale or other.threshold != self.threshold:
+            raise ValueError('cannot merge heatmaps of different venues or thresholds')
+        self.samples += other.samples
+        self.occupied += other.occupied
+        self.violations += other.violations
+        self.nearest_sum += other.nearest_sum
+        self.nearest_count += other.nearest_count
+
+    def occupancy_rate(self):
+        """
+        fraction of the seatings in which each seat was occupied
+        """
+        return self.occupied / max(self.samples, 1)
+
+    def violation_rate(self):
+        """
+        fraction of the seatings occupying each seat in which the person there violated the threshold
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.occupied > 0, self.violations / self.occupied, np.nan)
 
+    def mean_nearest(self):
+        """
+        mean distance from the person in each seat to the nearest individual from another group
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.nearest_count > 0, self.nearest_sum / self.nearest_count, np.nan)
 
+    def save(self, path):
+        """
+        writes the counts to an .npz file at path
+        """
+        np.savez(path, samples=self.samples, scale=self.scale, threshold=self.threshold,
+                 occupied=self.occupied, violations=self.violations,
+                 nearest_sum=self.nearest_sum, nearest_count=self.nearest_count)
 
+    @classmethod
+    def load(cls, path):
+        """
+        reads counts written by save()
+        """
+        with np.load(path) as data:
+            heatmaps = cls.__new__(cls)
+            heatmaps.shape = data['occupied'].shape
+            heatmaps.scale = tuple(data['scale'].tolist())
+            heatmaps.threshold = float(data['threshold'])
+            heatmaps.samples = int(data['samples'])
+            heatmaps.occupied = data['occupied']
+            heatmaps.violations = data['violations']
+            heatmaps.nearest_sum = data['nearest_sum']
+            heatmaps.nearest_count = data['nearest_count']
+        return heatmaps
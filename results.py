@@ -0,0 +1,327 @@
+import numpy as np
+import glob
+import os
+import copy
+import csv
+from Seating import BaseSeating
+
+"""
+Compact on-disk storage for solved seatings and bootstrap outputs
+"""
+
+def compact_int_dtype(min_value, max_value):
+    """
+    Returns the smallest signed integer dtype that can hold every value in [min_value, max_value]
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return dtype
+    return np.int64
+
+def group_size_table(groupids):
+    """
+    Takes a grid of group ids and returns an array where entry g-1 is the number of people
+    seated in group g
+    """
+    occupied = groupids[groupids > 0].astype(np.int64)
+    if len(occupied) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.bincount(occupied)[1:]
+
+
+class SeatingStore:
+    """
+    A class that stores many solved seatings for the same venue, appending them in chunks
+    of .npz files at saved/results/[name]/chunk_[i].npz instead of pickling each seating
+
+    Each chunk holds
+        groupids: (B, X, Y) array of the solved grids, in the smallest int dtype that fits
+        group_sizes: (B, G) array of the number of people in each group, padded with 0
+        metric_[key]: (B,) float array for every metric passed to append()
+
+    Attributes
+    ----------
+    name: str
+        name of the directory in saved/results holding the chunks
+    chunk_size: int
+        number of seatings buffered in memory before they are written to disk
+
+    Methods
+    -------
+    append(seating, **metrics)
+        buffers a solved seating and its metrics, writing a chunk when the buffer is full
+
+    flush()
+        writes any buffered seatings to a new chunk
+
+    position(), truncate(position)
+        flush and return the number of chunks written, and later delete the chunks written since
+
+    load()
+        reads every chunk and returns a dict of the concatenated arrays
+
+    to_seating(groupids, template)
+        rebuilds a BaseSeating from a stored grid, using an empty template seating
+    """
+
+    def __init__(self, name, chunk_size=256):
+        """
+        Creates a SeatingStore at saved/results/[name], continuing any chunks already there
+        """
+        self.name = name
+        self.chunk_size = chunk_size
+        self._dir = 'saved/results/{}'.format(name)
+        os.makedirs(self._dir, exist_ok=True)
+        self._n_chunks = len(self._chunk_paths())
+        self._grids = []
+        self._metrics = []
+
+    def __len__(self):
+        """
+        number of seatings in the store, including the ones still buffered
+        """
+        stored = 0
+        for path in self._chunk_paths():
+            with np.load(path) as chunk:
+                stored += chunk['groupids'].shape[0]
+        return stored + len(self._grids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def _chunk_paths(self):
+        return sorted(glob.glob('{}/chunk_*.npz'.format(self._dir)))
+
+    def append(self, seating: BaseSeating, **metrics):
+        """
+        buffers a copy of the solved seating grid together with its metrics
+        """
+        self._grids.append(np.array(seating.seating))
+        self._metrics.append(metrics)
+        if len(self._grids) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        writes the buffered seatings to the next chunk file
+        """
+        if len(self._grids) == 0:
+            return
+
+        grids = np.stack(self._grids)
+        groupids = grids.astype(compact_int_dtype(grids.min(), grids.max()))
+
+        # group size table, padded to the largest number of groups in the chunk
+        tables = [group_size_table(grid) for grid in groupids]
+        n_groups = max(len(table) for table in tables)
+        group_sizes = np.zeros((len(tables), n_groups), dtype=np.uint8)
+        for i, table in enumerate(tables):
+            group_sizes[i, :len(table)] = table
+
+        # every metric gets its own column, nan where a seating did not report it
+        keys = sorted(set(key for metrics in self._metrics for key in metrics))
+        columns = {}
+        for key in keys:
+            columns['metric_{}'.format(key)] = np.array([float(metrics.get(key, np.nan))
+                                                         for metrics in self._metrics])
+
+        np.savez_compressed('{}/chunk_{:05d}.npz'.format(self._dir, self._n_chunks),
+                            groupids=groupids, group_sizes=group_sizes, **columns)
+        self._n_chunks += 1
+        self._grids = []
+        self._metrics = []
+
+    def position(self):
+        """
+        flushes the buffered seatings and returns the number of chunks, which truncate() can
+        return the store to (e.g. when a checkpointed search is resumed)
+        """
+        self.flush()
+        return self._n_chunks
+
+    def truncate(self, position):
+        """
+        deletes the buffered seatings and every chunk written after position() returned position
+        """
+        for path in self._chunk_paths()[position:]:
+            os.remove(path)
+        self._n_chunks = len(self._chunk_paths())
+        self._grids = []
+        self._metrics = []
+
+    def load(self):
+        """
+        reads all chunks and returns a dict with 'groupids' (N, X, Y), 'group_sizes' (N, G)
+        and one (N,) array per metric. Buffered seatings must be flushed first to be included
+        """
+        chunks = []
+        for path in self._chunk_paths():
+            with np.load(path) as chunk:
+                chunks.append({key: chunk[key] for key in chunk.files})
+
+        if len(chunks) == 0:
+            return {'groupids': np.zeros((0, 0, 0), dtype=np.int8),
+                    'group_sizes': np.zeros((0, 0), dtype=np.uint8)}
+
+        result = {'groupids': np.concatenate([chunk['groupids'] for chunk in chunks])}
+
+        # pad group size tables to the same number of groups
+        n_groups = max(chunk['group_sizes'].shape[1] for chunk in chunks)
+        result['group_sizes'] = np.concatenate([
+            np.pad(chunk['group_sizes'], ((0, 0), (0, n_groups - chunk['group_sizes'].shape[1])))
+            for chunk in chunks])
+
+        # metrics missing from a chunk are filled with nan
+        keys = sorted(set(key for chunk in chunks for key in chunk if key.startswith('metric_')))
+        for key in keys:
+            result[key[len('metric_'):]] = np.concatenate([
+                chunk.get(key, np.full(chunk['groupids'].shape[0], np.nan)) for chunk in chunks])
+        return result
+
+    @staticmethod
+    def to_seating(groupids, template: BaseSeating):
+        """
+        returns a copy of the empty template seating with the people in groupids seated
+        """
+        seating = copy.deepcopy(template)
+        occupied = np.where(groupids > 0)
+        for x, y in zip(occupied[0], occupied[1]):
+            seating.add_person(x, y, groupids[x, y])
+        return seating
+
+
+class BootstrapLog:
+    """
+    A class that streams the outcome of every bootstrap sample to CSV files in saved/logs/[name]/,
+    so failed samples can be analysed without rerunning them. Rows are buffered and appended every
+    flush_every rows, so memory use does not grow with the number of samples. Each process writes
+    its own file, run_[pid].csv, so several worker processes can log at the same time without
+    locking. read() merges all of them. 
+
+    Columns
+    -------
+    ticket_count, sample: the ticket count tested and the index of the sample
+    good: 1 if the solved seating had no threshold violations, 0 otherwise
+    violations: total number of threshold violations
+    nearest_distance: average distance to the nearest individual from another group
+    n_groups: number of groups sampled
+    groups_1 ... groups_[max_group_size]: number of groups of each size
+
+    Methods
+    -------
+    write(ticket_count, sample, good, violations, nearest_distance, groups)
+        buffers one row, appending the buffer to this process's file when it is full
+
+    flush()
+        appends the buffered rows to this process's file
+
+    position(), truncate(position)
+        flush and return the size of every file, and later cut the files back to those sizes
+
+    read()
+        reads the files of every process and returns a dict of column arrays
+    """
+
+    def __init__(self, name, max_group_size=4, flush_every=100):
+        """
+        Creates a BootstrapLog at saved/logs/[name], appending to any files already there
+        """
+        self.name = name
+        self.max_group_size = max_group_size
+        self.flush_every = flush_every
+        self._dir = 'saved/logs/{}'.format(name)
+        os.makedirs(self._dir, exist_ok=True)
+        self._rows = []
+
+    @property
+    def columns(self):
+        return (['ticket_count', 'sample', 'good', 'violations', 'nearest_distance', 'n_groups'] + 
+                ['groups_{}'.format(size) for size in range(1, self.max_group_size + 1)])
+
+    def __getstate__(self):
+        # a copy sent to another process starts with an empty buffer
+        state = dict(self.__dict__)
+        state['_rows'] = []
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def write(self, ticket_count, sample, good, violations, nearest_distance, groups):
+        """
+        buffers the outcome of one sample, groups is the list of group sizes that was sampled
+        """
+        histogram = np.bincount(np.asarray(groups, dtype=np.int64), minlength=self.max_group_size + 1)
+        if len(histogram) > self.max_group_size + 1:
+            raise ValueError('group of {} is larger than max_group_size'.format(len(histogram) - 1))
+
+        self._rows.append([ticket_count, sample, int(good), violations, nearest_distance, len(groups)] + 
+                          histogram[1:].tolist())
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        appends the buffered rows to the file of the current process
+        """
+        if len(self._rows) == 0:
+            return
+        path = '{}/run_{}.csv'.format(self._dir, os.getpid())
+        new = not os.path.exists(path)
+        with open(path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(self.columns)
+            writer.writerows(self._rows)
+        self._rows = []
+
+    def position(self):
+        """
+        flushes the buffered rows and returns {file name -> size in bytes} for every file, which
+        truncate() can return the log to (e.g. when a checkpointed search is resumed)
+        """
+        self.flush()
+        return {os.path.basename(path): os.path.getsize(path) 
+                for path in glob.glob('{}/run_*.csv'.format(self._dir))}
+
+    def truncate(self, position):
+        """
+        deletes the buffered rows, cuts every file back to its size in position and deletes the
+        files that were created after position() returned position
+        """
+        self._rows = []
+        for path in glob.glob('{}/run_*.csv'.format(self._dir)):
+            size = position.get(os.path.basename(path))
+            if size is None:
+                os.remove(path)
+            else:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def read(self):
+        """
+        reads every process's file and returns a dict mapping each column to an array.
+        Rows still buffered (in any process) are not included
+        """
+        rows = []
+        for path in sorted(glob.glob('{}/run_*.csv'.format(self._dir))):
+            with open(path, newline='') as f:
+                reader = csv.reader(f)
+                next(reader) # header
+                rows.extend(reader)
+
+        values = np.array(rows, dtype=float).reshape(len(rows), len(self.columns))
+        result = {}
+        for i, column in enumerate(self.columns):
+            if column == 'nearest_distance':
+                result[column] = values[:, i]
+            else:
+                result[column] = values[:, i].astype(np.int64)
+        return result
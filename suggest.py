@@ -3,7 +3,12 @@ from Solvers import ExhaustiveGreedySolver
 from Attendees import BaseAttendees
 from Seating import BaseSeating
 import copy
-from evaluate import evaluate_closerthan_thresh
+import os
+import pickle
+import random
+import time
+from scipy.stats import norm
+from evaluate import evaluate_closerthan_thresh, evaluate_nearest_distance, SeatingHeatmaps
 
 class Search():
     """
@@ -53,6 +58,82 @@ class Search():
         else:
             return False
 
+class Checkpoint():
+    """
+    A class that is used by suggest_n_tickets to save its progress to a pickle file, so that an
+    interrupted search can be resumed. It holds the outcome of every ticket count that has been
+    tested, the bootstrap runs of the count being tested, the Search bounds and the random state.
+
+    The outputs the samples are written to (a SeatingStore, a BootstrapLog and a dict of 
+    SeatingHeatmaps) are checkpointed with them: the store and log are flushed and their 
+    positions saved, and the heatmaps are saved whole. On resume, the store and log are truncated 
+    and the heatmaps restored, so samples run after the last save are not counted twice.
+    """
+    def __init__(self, path, every, settings, store=None, log=None, heatmaps=None):
+        """
+        Initialize an empty checkpoint that is written to path (nothing is written if path is None)
+        every `every` bootstrap samples. settings are the search parameters, which must match on resume
+        """
+        self.path = path
+        self.every = every
+        self.settings = settings
+        self.completed = {} # ticket count -> whether it was safe
+        self.partial = {} # ticket count -> bootstrap runs so far
+        self.search = None
+        self.store = store
+        self.log = log
+        self.heatmaps = heatmaps
+
+    @classmethod
+    def load(cls, path, every, settings, store=None, log=None, heatmaps=None):
+        """
+        Loads a checkpoint from path, restores the random state it was saved with and returns
+        store, log and heatmaps to the state they were saved in
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state['settings'] != settings:
+            raise ValueError('checkpoint at {} was made with different search parameters'.format(path))
+
+        checkpoint = cls(path, every, settings, store, log, heatmaps)
+        checkpoint.completed = state['completed']
+        checkpoint.partial = state['partial']
+        checkpoint.search = state['search']
+        np.random.set_state(state['np_random'])
+        random.setstate(state['random'])
+
+        # outputs that were not checkpointed (e.g. not passed to the first run) are left as they are
+        if store is not None and state.get('store') is not None:
+            store.truncate(state['store'])
+        if log is not None and state.get('log') is not None:
+            log.truncate(state['log'])
+        if heatmaps is not None and state.get('heatmaps') is not None:
+            heatmaps.clear()
+            heatmaps.update(state['heatmaps'])
+        return checkpoint
+
+    def save(self, search):
+        """
+        Writes the checkpoint, replacing the previous file only once the new one is complete
+        """
+        self.search = {'min_': search.min_, 'max_': search.max_, 'last': getattr(search, 'last', None)}
+        if self.path is None:
+            return
+        state = {
+            'settings': self.settings,
+            'completed': self.completed,
+            'partial': self.partial,
+            'search': self.search,
+            'np_random': np.random.get_state(),
+            'random': random.getstate(),
+            'store': None if self.store is None else self.store.position(),
+            'log': None if self.log is None else self.log.position(),
+            'heatmaps': self.heatmaps
+        }
+        with open(self.path + '.tmp', 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+
 def check_pass(runs, tolerance):
     """
     Checks if the percentage of failed runs is within the allowed tolerance. 
@@ -76,8 +157,26 @@ def percent_failed(runs):
     runs = np.array(runs).astype(int)
     return 1 - (sum(runs) / len(runs))
 
+def capacity_upper_bound(expected_attendee_dist, seating: BaseSeating, threshold):
+    """
+    Returns a fast upper end for the search over the number of attendees, drawn from 
+    expected_attendee_dist, that can be seated without threshold violations. 
+
+    For every group size in the distribution, groups of only that size are packed into the
+    seating with BaseSeating.remaining_capacity (row-major, each group blocking the seats within
+    threshold of it). Mixing group sizes does not seat more people than the densest of these
+    packings, so the bound is the most attendees seated by any of them, plus the largest group
+    size for the last group, capped at the number of empty seats. The packings are greedy, so
+    this is a tight estimate rather than a proof; on small venues it stays above the largest
+    count ExhaustiveGreedySolver seats without violations (see tests/test_suggest.py). 
+    """
+    capacity = seating.remaining_capacity(sorted(expected_attendee_dist), threshold)
+    bound = max(size * count for size, count in capacity.items()) + max(expected_attendee_dist)
+    return int(min(bound, seating.available_seats().sum()))
+
 def suggest_n_tickets(expected_attendee_dist, seating: BaseSeating, bootstrap_samples, threshold=1.5,
-                      tolerance=0.05, verbose=True):
+                      tolerance=0.05, verbose=True, store=None, checkpoint=None, resume=False,
+                      checkpoint_every=10, callback=None, cache=None, log=None, bound=True, heatmaps=None):
     """
     A function that suggests a number of tickets to make available / a total number of attendees
     to allow. It does this by searching through the possible total numbers of attendees for a given 
@@ -100,19 +199,83 @@ def suggest_n_tickets(expected_attendee_dist, seating: BaseSeating, bootstrap_sa
         If the percentage of solved seatings that violates the threshold, for a given number of total 
         attendees, exceeds the tolerance, then this number of total attendees is considered too many, 
         and the search interval will shift to below the midpoint. 
+    store: SeatingStore
+        if given, every solved seating from the bootstrap runs is appended to this store
+    checkpoint: str
+        path of a file where the search progress is saved after every tested ticket count and 
+        every checkpoint_every bootstrap samples
+    resume: bool
+        if True and the checkpoint file exists, the search continues from it instead of starting over. 
+        Ticket counts that were already tested are not solved again. store, log and heatmaps are
+        returned to their state at the last checkpoint, so they must be the same ones (or reopened
+        under the same names) as in the interrupted search. With a checkpoint, the store and log
+        are flushed at every save. 
+    callback: function
+        if given, called with a dict for every progress event: 
+            {'event': 'sample', 'ticket_count', 'sample', 'samples', 'good', 'failures', 'eta'}
+            after each bootstrap sample, where eta is the estimated seconds left for this ticket count
+            {'event': 'count', 'ticket_count', 'safe'} after each tested ticket count
+            {'event': 'converged', 'min', 'max'} once the search interval is small
+            {'event': 'done', 'ticket_count'} with the suggestion
+    cache: SolveCache
+        if given, passed to is_safe so that repeated group size draws are not solved again
+    log: BootstrapLog
+        if given, every bootstrap sample is written to this log
+    bound: bool
+        if True, the search starts below capacity_upper_bound instead of the total number of seats
+    heatmaps: dict{int->SeatingHeatmaps}
+        if given, a SeatingHeatmaps is kept for every ticket count tested, accumulating its bootstrap
+        seatings. Entries already in the dict are updated in place
     """
     # initialize searcher and get first n_attendees
-    search = Search(0, seating.totalseats)
+    max_attendees = seating.totalseats
+    if bound:
+        max_attendees = min(max_attendees, capacity_upper_bound(expected_attendee_dist, seating, threshold))
+    search = Search(0, max_attendees)
     n_attendees = search.first()
 
+    # load or start the checkpoint, which remembers the outcome of every ticket count tested
+    settings = (expected_attendee_dist, bootstrap_samples, threshold, tolerance)
+    if resume and checkpoint is not None and os.path.exists(checkpoint):
+        progress = Checkpoint.load(checkpoint, checkpoint_every, settings, store, log, heatmaps)
+    else:
+        progress = Checkpoint(checkpoint, checkpoint_every, settings, store, log, heatmaps)
+
+    def emit(event):
+        if callback is not None:
+            callback(event)
+
+    def test(count):
+        """
+        Helper function that tests a ticket count, unless the checkpoint already knows its outcome
+        """
+        if count in progress.completed:
+            return progress.completed[count]
+
+        def on_sample(event):
+            emit(event)
+            if progress.every and event['sample'] % progress.every == 0:
+                progress.save(search)
+
+        runs = progress.partial.setdefault(count, [])
+        if heatmaps is not None and count not in heatmaps:
+            heatmaps[count] = SeatingHeatmaps(seating, threshold)
+        safe = is_safe(expected_attendee_dist, copy.deepcopy(seating), count, bootstrap_samples, 
+                       threshold, tolerance, verbose=verbose, store=store, runs=runs, callback=on_sample,
+                       cache=cache, log=log, heatmaps=None if heatmaps is None else heatmaps[count])
+        progress.completed[count] = safe
+        del progress.partial[count]
+        progress.save(search)
+        emit({'event': 'count', 'ticket_count': count, 'safe': safe})
+        return safe
+
     # until "convergence", however convergence in this case is pseudo-convergence as we 
     # wait until the search interval is smaller than 5, and then search the remainder
     # exhaustively. 
     while not search.converged_initial():
         if verbose:
             print('searching, {} attendees'.format(n_attendees))
-        if is_safe(expected_attendee_dist, copy.deepcopy(seating), n_attendees, bootstrap_samples, 
-                   threshold, tolerance):
+        if test(n_attendees):
             # if this n_attendees is safe, shift search interval to look for more attendees
             n_attendees = search.more()
         else:
@@ -121,16 +284,19 @@ def suggest_n_tickets(expected_attendee_dist, seating: BaseSeating, bootstrap_sa
 
     if verbose:
         print('initial convergence, search min = {}, search max = {}'.format(round(search.min_), round(search.max_)))
+    emit({'event': 'converged', 'min': search.min_, 'max': search.max_})
 
     # now that the search range is smaller, start from the max of the search range (rounding up)
     # and descend sequentially, returning the first successful n_attendees.  
     for proposed_n_attendees in range(int(search.max_) + 1, 0, -1):
-        print('testing {} attendees'.format(proposed_n_attendees))
-        if is_safe(expected_attendee_dist, copy.deepcopy(seating), proposed_n_attendees,
-                   bootstrap_samples, threshold, tolerance):
+        if verbose:
+            print('testing {} attendees'.format(proposed_n_attendees))
+        if test(proposed_n_attendees):
+            emit({'event': 'done', 'ticket_count': proposed_n_attendees})
             return proposed_n_attendees
 
-def is_safe(expected_attendee_dist, seating, ticket_count, bootstrap_samples, threshold, tolerance, verbose=True, earlystop=25):
+def is_safe(expected_attendee_dist, seating, ticket_count, bootstrap_samples, threshold, tolerance, verbose=True, earlystop=25,
+            store=None, runs=None, callback=None, cache=None, log=None, heatmaps=None):
     """
     A function that determines whether a given number of tickets would be safe for a seating arrangement, 
     given an expected distribution of attendees, a social distancing threshold and a tolerane. 
@@ -157,37 +323,84 @@ def is_safe(expected_attendee_dist, seating, ticket_count, bootstrap_samples, th
         If nonzero, after earlystop samples, if the percentage of threshold-violating samples is 
         already double the tolerance, the run stops early, returning False, and the setup is
         considered unsafe. 
+    store : SeatingStore
+        if given, every solved seating is appended to this store with the ticket count and 
+        whether it passed as metrics
+    runs : list[bool]
+        outcomes of bootstrap samples that were already run for this ticket count (e.g. restored
+        from a checkpoint). Sampling continues from there, and new outcomes are appended to this list. 
+    callback : function
+        if given, called after every sample with a dict 
+        {'event': 'sample', 'ticket_count', 'sample', 'samples', 'good', 'failures', 'eta'}
+    cache : SolveCache
+        if given, samples whose group sizes were already solved for this seating reuse the cached
+        outcome, and other solves reuse the cached placements of their largest groups
+    log : BootstrapLog
+        if given, the outcome, metrics and group sizes of every sample are written to this log
+    heatmaps : SeatingHeatmaps
+        if given, every solved seating is added to these per-seat accumulators
     """
     
-    def run_test():
+    def run_test(sample):
         """
         Helper function to run an individual sample. 
         """
         # samples a new BaseAttendees from the weights in the expected_attendee_dist
         attendees = BaseAttendees.from_probs(expected_attendee_dist, ticket_count)
+
+        # the same group sizes were already solved and evaluated on this seating
+        if cache is not None and store is None and log is None and heatmaps is None:
+            entry = cache.get(cache.key(seating, ('ExhaustiveGreedySolver', 'descending'), attendees.groups))
+            if entry is not None and ('good', threshold) in entry['metrics']:
+                return entry['metrics'][('good', threshold)]
+
         test_seating = copy.deepcopy(seating)
         # solves the seating
         solver = ExhaustiveGreedySolver(test_seating, attendees)
-        solver.solve()
+        solver.solve(cache=cache)
         # evaluates whether the solved seating has no pairs of individuals from different
         # groups sitting closer together than the threshold
-        good = evaluate_closerthan_thresh(test_seating, threshold, reduce_='boolean')
+        if log is None:
+            good = evaluate_closerthan_thresh(test_seating, threshold, reduce_='boolean')
+        else:
+            violations = evaluate_closerthan_thresh(test_seating, threshold, reduce_='sum')
+            good = violations == 0
+            log.write(ticket_count, sample, good, violations, evaluate_nearest_distance(test_seating),
+                      attendees.init_groups)
+        if cache is not None:
+            # the entry may already have been evicted (e.g. by a cache with maxsize 0)
+            entry = cache.get(solver.cache_key)
+            if entry is not None:
+                entry['metrics'][('good', threshold)] = good
+        if store is not None:
+            store.append(test_seating, ticket_count=ticket_count, good=good)
+        if heatmaps is not None:
+            heatmaps.update(test_seating)
         return good
     
-    runs = []
-    # runs bootstrap_samples times
-    for i in range(0, bootstrap_samples):
-        good = run_test()
+    if runs is None:
+        runs = []
+    start, start_index = time.time(), len(runs)
+    # runs bootstrap_samples times, skipping the ones that were already run
+    for i in range(len(runs), bootstrap_samples):
+        good = run_test(i)
         if verbose and not good:
             print('run {} of {} failed'.format(i+1, bootstrap_samples))
 
         runs.append(good)
 
+        if callback is not None:
+            per_sample = (time.time() - start) / (i + 1 - start_index)
+            callback({'event': 'sample', 'ticket_count': ticket_count, 'sample': i + 1, 
+                      'samples': bootstrap_samples, 'good': good, 'failures': n_failures(runs),
+                      'eta': per_sample * (bootstrap_samples - i - 1)})
+
         # if earlystop != 0, and we have processed the earlystop amount of runs, and we fail
         # more than 2x what would be allowed according to the tolerance, the setup is considered
         # unsafe. 
         if earlystop and earlystop-1 == i and not check_pass(runs, tolerance*2):
-            print('stopping early with {} of {} failures'.format(n_failures(runs), earlystop))
+            if verbose:
+                print('stopping early with {} of {} failures'.format(n_failures(runs), earlystop))
             return False
         
     if check_pass(runs, tolerance):
@@ -198,3 +411,380 @@ def is_safe(expected_attendee_dist, seating, ticket_count, bootstrap_samples, th
         if verbose:
             print('{} tickets fails with {} / {} failures'.format(ticket_count, n_failures(runs), bootstrap_samples))
         return False
+
+def sample_runs(attendee_dist, seating, ticket_count, samples, threshold, cache=None):
+    """
+    Solves samples sets of attendees drawn from attendee_dist and records, for each sample,
+    the group sizes that were drawn and whether the solved seating was violation-free, so that
+    failure rates for other attendee distributions can be estimated by reweighted_failure_rate
+    without solving again. A broad proposal (e.g. equal weights for all group sizes) keeps the
+    estimates for many target distributions accurate. 
+
+    Returns a dict with
+        ticket_count, proposal: the ticket count and attendee_dist that were sampled
+        groups: (samples, max group size) array of the number of groups of each size drawn, 
+            not counting the last group that takes the tickets left over
+        remainder: (samples,) array of the size of that last group
+        good: (samples,) bool array, True if the seating had no threshold violations
+    """
+    max_size = max(attendee_dist)
+    groups = np.zeros((samples, max_size), dtype=np.int64)
+    remainder = np.zeros(samples, dtype=np.int64)
+    good = np.zeros(samples, dtype=bool)
+
+    for i in range(samples):
+        attendees = BaseAttendees.from_probs(attendee_dist, ticket_count)
+        drawn = list(attendees.init_groups)
+        drawn.remove(attendees.remainder)
+        groups[i] = np.bincount(np.array(drawn, dtype=np.int64), minlength=max_size + 1)[1:]
+        remainder[i] = attendees.remainder
+
+        test_seating = copy.deepcopy(seating)
+        ExhaustiveGreedySolver(test_seating, attendees).solve(cache=cache)
+        good[i] = evaluate_closerthan_thresh(test_seating, threshold, reduce_='boolean')
+
+    return {'ticket_count': ticket_count, 'proposal': dict(attendee_dist),
+            'groups': groups, 'remainder': remainder, 'good': good}
+
+def _size_probabilities(attendee_dist, max_size):
+    """
+    Returns an array whose entry k-1 is the probability of drawing a group of size k
+    """
+    probabilities = np.zeros(max_size)
+    for size, weight in attendee_dist.items():
+        probabilities[size - 1] = weight
+    return probabilities / probabilities.sum()
+
+def _draw_groups(attendee_dist, ticket_count, draws):
+    """
+    Draws the group sizes of draws sets of ticket_count attendees at once, like 
+    BaseAttendees.from_probs: sizes are drawn until the next one would reach ticket_count, and 
+    the last group takes the tickets left over. Returns (sizes, n_drawn, remainder), where row i 
+    of the (draws, ticket_count) array sizes holds the drawn sizes of set i in its first 
+    n_drawn[i] entries, and remainder[i] is the size of its last group
+    """
+    max_size = max(attendee_dist)
+    sizes = np.random.choice(np.arange(1, max_size + 1), size=(draws, max(ticket_count, 1)),
+                             p=_size_probabilities(attendee_dist, max_size))
+    # every draw holds at least one ticket, so the tickets run out within ticket_count draws
+    totals = np.cumsum(sizes, axis=1)
+    n_drawn = np.argmax(totals >= ticket_count, axis=1)
+    before = np.where(n_drawn > 0, totals[np.arange(draws), np.maximum(n_drawn - 1, 0)], 0)
+    return sizes, n_drawn, ticket_count - before
+
+def likelihood_ratios(runs, target_dist):
+    """
+    Returns the weight of every sample in runs (from sample_runs) for estimating expectations
+    under target_dist, the ratio of the probability of drawing its groups under target_dist to
+    that under the proposal. Every drawn group contributes the ratio of its size's 
+    probabilities, and the last group the ratio of the probabilities of drawing a group at
+    least as large as it. 
+    """
+    max_size = max(runs['groups'].shape[1], max(target_dist))
+    p = _size_probabilities(runs['proposal'], max_size)
+    q = _size_probabilities(target_dist, max_size)
+    if ((q > 0) & (p == 0)).any():
+        raise ValueError('target distribution draws group sizes the proposal never draws')
+
+    # log ratios, -inf for sizes the target never draws
+    with np.errstate(divide='ignore'):
+        log_ratio = np.where(p > 0, np.log(q) - np.log(np.where(p > 0, p, 1)), 0)
+        log_tail_ratio = np.log(np.cumsum(q[::-1])[::-1]) - np.log(np.cumsum(p[::-1])[::-1])
+
+    groups = np.pad(runs['groups'], ((0, 0), (0, max_size - runs['groups'].shape[1])))
+    log_weights = np.where(groups > 0, groups * log_ratio, 0).sum(axis=1)
+    log_weights += log_tail_ratio[runs['remainder'] - 1]
+    if np.isneginf(log_weights).all():
+        return np.zeros(len(log_weights))
+    return np.exp(log_weights - log_weights.max())
+
+def reweighted_failure_rate(runs, target_dist):
+    """
+    Estimates the fraction of seatings for target_dist that would violate the threshold from
+    the samples in runs, drawn from another distribution by sample_runs. Returns the
+    self-normalized importance sampling estimate and its effective sample size, which is low
+    when target_dist is far from the proposal. 
+    """
+    weights = likelihood_ratios(runs, target_dist)
+    total = weights.sum()
+    if total == 0:
+        return np.nan, 0.0
+    failure_rate = (weights * ~runs['good']).sum() / total
+    ess = total ** 2 / (weights ** 2).sum()
+    return failure_rate, ess
+
+def estimate_failure_rate(target_dist, seating, runs, threshold, min_ess=50, fallback_samples=100, 
+                          tolerance=None, cache=None, verbose=True):
+    """
+    Estimates the failure rate that is_safe would measure for target_dist at runs['ticket_count'], 
+    by reweighting the samples in runs. If the effective sample size is below min_ess, the
+    estimate is not trusted and fallback_samples fresh samples are solved from target_dist instead. 
+
+    Returns a dict {'failure_rate', 'ess', 'reweighted'}, plus 'safe' if a tolerance is given
+    """
+    failure_rate, ess = reweighted_failure_rate(runs, target_dist)
+    reweighted = bool(ess >= min_ess)
+    if not reweighted:
+        if verbose:
+            print('effective sample size {:.1f} < {}, sampling {} fresh seatings'.format(ess, min_ess, fallback_samples))
+        fresh = sample_runs(target_dist, seating, runs['ticket_count'], fallback_samples, threshold, cache=cache)
+        failure_rate, ess = percent_failed(fresh['good']), float(fallback_samples)
+
+    result = {'failure_rate': float(failure_rate), 'ess': float(ess), 'reweighted': reweighted}
+    if tolerance is not None:
+        result['safe'] = bool(failure_rate <= tolerance)
+    return result
+
+def stratified_failure_rate(expected_attendee_dist, seating, ticket_count, threshold, rel_error=0.25, tolerance=None,
+                            max_samples=200, pilot=4, batch=8, n_strata=4, large_size=3, draws=5000,
+                            confidence=0.95, cache=None, verbose=True):
+    """
+    Estimates the fraction of seatings that violate the threshold for ticket_count attendees
+    drawn from expected_attendee_dist, with a confidence interval, using far fewer solves than
+    plain bootstrap sampling when failures are rare. 
+
+    Failures mostly depend on how many large groups were drawn, so the samples are stratified
+    by the number of groups of at least large_size. Drawing attendees is cheap compared to
+    solving, so draws sets of attendees are drawn first (without solving) to estimate the
+    probability of every stratum, and the solved samples are taken from them. After pilot
+    samples per stratum, batches of samples are allocated to the strata by Neyman allocation, 
+    in proportion to the stratum probability times the standard deviation of its outcome. 
+    Stratum variances use the Jeffreys estimate (failures + 0.5) / (samples + 1), so strata 
+    without failures yet still get samples. 
+
+    Sampling stops when the half width of the confidence interval is at most rel_error times the
+    estimate, when the interval lies entirely on one side of tolerance (if given), or after
+    max_samples solves. 
+
+    Returns a dict {'failure_rate', 'ci', 'samples', 'strata'}, where strata maps each stratum
+    (a range of large group counts) to its probability, samples and failures, plus 'safe' if 
+    a tolerance is given
+    """
+    z = norm.ppf(0.5 + confidence / 2)
+
+    # cheap draws of group sizes, stratified by quantiles of their number of large groups
+    sizes, n_drawn, remainder = _draw_groups(expected_attendee_dist, ticket_count, draws)
+    drawn = np.arange(sizes.shape[1]) < n_drawn[:, None]
+    large = ((sizes >= large_size) & drawn).sum(axis=1) + (remainder >= large_size)
+    edges = np.unique(np.quantile(large, np.linspace(0, 1, n_strata + 1)[1:-1]))
+    strata = np.searchsorted(edges, large, side='right')
+    labels = np.unique(strata)
+    probs = np.array([np.mean(strata == h) for h in labels])
+    members = [list(np.random.permutation(np.where(strata == h)[0])) for h in labels]
+    n = np.zeros(len(labels), dtype=np.int64)
+    failures = np.zeros(len(labels), dtype=np.int64)
+
+    def run(h):
+        """
+        solves the next drawn attendees of stratum h
+        """
+        i = members[h].pop()
+        attendees = BaseAttendees(sizes[i, :n_drawn[i]].tolist() + [int(remainder[i])], 'from_probs')
+        attendees.remainder = int(remainder[i])
+        test_seating = copy.deepcopy(seating)
+        ExhaustiveGreedySolver(test_seating, attendees).solve(cache=cache)
+        n[h] += 1
+        failures[h] += not evaluate_closerthan_thresh(test_seating, threshold, reduce_='boolean')
+
+    def estimate():
+        """
+        returns the stratified estimate and the half width of its confidence interval
+        """
+        sampled = n > 0
+        rates = np.where(sampled, failures / np.maximum(n, 1), (failures + 0.5) / (n + 1))
+        jeffreys = (failures + 0.5) / (n + 1)
+        variance = (probs ** 2 * jeffreys * (1 - jeffreys) / np.maximum(n, 1)).sum()
+        return (probs * rates).sum(), z * np.sqrt(variance)
+
+    # pilot samples in every stratum
+    for h in range(len(labels)):
+        for _ in range(min(pilot, len(members[h]))):
+            run(h)
+
+    failure_rate, half_width = estimate()
+    while n.sum() < max_samples:
+        if failure_rate > 0 and half_width <= rel_error * failure_rate:
+            break
+        if tolerance is not None and (failure_rate + half_width < tolerance or failure_rate - half_width > tolerance):
+            break
+
+        # Neyman allocation of the next batch, to the strata furthest below their share
+        jeffreys = (failures + 0.5) / (n + 1)
+        shares = probs * np.sqrt(jeffreys * (1 - jeffreys))
+        left = np.array([len(m) for m in members])
+        shares[left == 0] = 0
+        if shares.sum() == 0:
+            break
+        for _ in range(min(batch, max_samples - n.sum())):
+            targets = shares / shares.sum() * (n.sum() + 1)
+            deficits = np.where(left > 0, targets - n, -np.inf)
+            h = int(np.argmax(deficits))
+            if left[h] == 0:
+                break
+            run(h)
+            left[h] -= 1
+
+        failure_rate, half_width = estimate()
+        if verbose:
+            print('{} samples, failure rate {:.4f} +- {:.4f}'.format(n.sum(), failure_rate, half_width))
+
+    result = {
+        'failure_rate': float(failure_rate),
+        'ci': (float(max(0, failure_rate - half_width)), float(min(1, failure_rate + half_width))),
+        'samples': int(n.sum()),
+        'strata': {}
+    }
+    for h, label in enumerate(labels):
+        values = large[strata == label]
+        result['strata'][(int(values.min()), int(values.max()))] = {
+            'probability': float(probs[h]), 'samples': int(n[h]), 'failures': int(failures[h])}
+    if tolerance is not None:
+        result['safe'] = result['ci'][1] <= tolerance
+    return result
+
+class CapacityCurve():
+    """
+    A class that models the probability that a solved seating violates the threshold as a 
+    logistic function of the ticket count, fitted to the outcomes of every sample tested so far
+    at any count. The slope is constrained to at least min_slope during the fit, so the failure 
+    probability increases with the ticket count. A weak gaussian prior on both parameters keeps 
+    the fit finite when the outcomes are separated (e.g. every sample below some count was good). 
+    """
+    min_slope = 1e-6 # smallest slope, per standard deviation of the ticket counts
+
+    def __init__(self, prior=0.01):
+        """
+        Initialize an unfitted curve, prior is the precision of the prior on the parameters
+        """
+        self.prior = prior
+        self.counts = []
+        self.failures = []
+
+    def add(self, count, good):
+        """
+        Adds the outcomes (True if the seating was violation-free) of samples at a ticket count
+        """
+        self.counts.extend([count] * len(good))
+        self.failures.extend([not g for g in good])
+
+    def fit(self):
+        """
+        Fits the intercept and slope by Newton's method on the penalized log likelihood, with 
+        ticket counts standardized, and keeps the inverse hessian as their covariance. 
+
+        The slope is kept at least min_slope: while it is at that bound and the likelihood 
+        would rather decrease it, only the intercept is updated. Every step is halved until
+        the penalized log likelihood does not decrease, so the fit cannot overshoot
+        """
+        counts = np.array(self.counts, dtype=float)
+        failures = np.array(self.failures, dtype=float)
+        self.center = counts.mean()
+        self.scale = counts.std() if counts.std() > 0 else 1.0
+        X = np.column_stack((np.ones(len(counts)), (counts - self.center) / self.scale))
+
+        theta = np.array([0.0, self.min_slope])
+        for _ in range(100):
+            gradient, hessian = self._derivatives(X, failures, theta)
+            if theta[1] <= self.min_slope and gradient[1] <= 0:
+                # the slope is held at its bound, so only the intercept moves
+                step = np.array([gradient[0] / hessian[0, 0], 0.0])
+            else:
+                step = np.linalg.solve(hessian, gradient)
+
+            # damp the step until the penalized log likelihood does not decrease
+            current = self._log_likelihood(X, failures, theta)
+            for halvings in range(30):
+                candidate = theta + step / 2 ** halvings
+                candidate[1] = max(candidate[1], self.min_slope)
+                if self._log_likelihood(X, failures, candidate) >= current:
+                    break
+            else:
+                break
+            moved = np.abs(candidate - theta).max()
+            theta = candidate
+            if moved < 1e-8:
+                break
+
+        _, hessian = self._derivatives(X, failures, theta)
+        self.theta = theta
+        self.cov = np.linalg.inv(hessian)
+        return self
+
+    def _log_likelihood(self, X, failures, theta):
+        # penalized log likelihood of the standardized design X at the parameters theta
+        z = X @ theta
+        return failures @ z - np.logaddexp(0, z).sum() - self.prior * theta @ theta / 2
+
+    def _derivatives(self, X, failures, theta):
+        # gradient and (negated) hessian of the penalized log likelihood at theta
+        p = 1 / (1 + np.exp(-X @ theta))
+        gradient = X.T @ (failures - p) - self.prior * theta
+        hessian = (X.T * (p * (1 - p))) @ X + self.prior * np.eye(2)
+        return gradient, hessian
+
+    def failure_probability(self, count):
+        """
+        Returns the fitted failure probability at count
+        """
+        z = self.theta[0] + self.theta[1] * (np.asarray(count) - self.center) / self.scale
+        return 1 / (1 + np.exp(-z))
+
+    def crossing(self, tolerance, confidence=0.95):
+        """
+        Returns the ticket count where the fitted failure probability equals tolerance, and a
+        (lower, upper) confidence band for it from the delta method
+        """
+        a, b = self.theta
+        target = np.log(tolerance / (1 - tolerance))
+        x = (target - a) / b
+        gradient = np.array([-1 / b, -(target - a) / b ** 2])
+        spread = norm.ppf(0.5 + confidence / 2) * np.sqrt(gradient @ self.cov @ gradient)
+        return (self.center + self.scale * x, 
+                self.center + self.scale * (x - spread), 
+                self.center + self.scale * (x + spread))
+
+def suggest_n_tickets_curve(expected_attendee_dist, seating: BaseSeating, threshold=1.5, tolerance=0.05, 
+                            samples_per_round=10, max_rounds=20, band_width=4, confidence=0.95, bound=True, 
+                            cache=None, verbose=True):
+    """
+    Suggests a ticket count like suggest_n_tickets, but fits a CapacityCurve to the samples of 
+    every count tested instead of deciding each count on its own samples. Each round solves
+    samples_per_round samples at the count where the fitted failure probability crosses the 
+    tolerance, which is where new samples narrow the estimate of the crossing the most. 
+    The search stops once the confidence band of the crossing is at most band_width tickets wide, 
+    or after max_rounds rounds. 
+
+    Returns (suggestion, (lower, upper), curve): the largest count whose fitted failure probability 
+    is at most the tolerance, the confidence band of that count (lower is the conservative
+    choice) and the fitted CapacityCurve
+    """
+    max_attendees = seating.totalseats
+    if bound:
+        max_attendees = min(max_attendees, capacity_upper_bound(expected_attendee_dist, seating, threshold))
+    curve = CapacityCurve()
+
+    # start with samples spread over the range, so the slope is identified. Small venues can
+    # round some of these to the same count or to 0, which from_probs cannot sample
+    starts = sorted(set(max(start, 1) for start in (max_attendees // 4, max_attendees // 2, 
+                                                     (3 * max_attendees) // 4)))
+    for start in starts:
+        curve.add(start, sample_runs(expected_attendee_dist, seating, start, samples_per_round, threshold, 
+                                     cache=cache)['good'])
+
+    for round_ in range(max_rounds):
+        estimate, lower, upper = curve.fit().crossing(tolerance, confidence)
+        if verbose:
+            print('round {}, {} samples, crossing at {:.1f} ({:.1f} - {:.1f})'.format(
+                round_, len(curve.counts), estimate, lower, upper))
+        if upper - lower <= band_width:
+            break
+
+        # sample where the curve crosses the tolerance
+        count = int(np.clip(round(estimate), 1, max_attendees))
+        curve.add(count, sample_runs(expected_attendee_dist, seating, count, samples_per_round, threshold, 
+                                     cache=cache)['good'])
+
+    estimate, lower, upper = curve.fit().crossing(tolerance, confidence)
+    suggestion = int(np.clip(np.floor(estimate), 1, max_attendees))
+    band = (int(np.clip(np.floor(lower), 1, max_attendees)), int(np.clip(np.ceil(upper), 1, max_attendees)))
+    return suggestion, band, curve
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top level of the repo and load their settings from saved/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def in_repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
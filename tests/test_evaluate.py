@@ -0,0 +1,43 @@
+import copy
+
+import numpy as np
+import pytest
+
+from Attendees import BaseAttendees
+from Seating import BaseSeating, LengthWidthSeating
+from Solvers import ExhaustiveGreedySolver, NaiveSolver
+from evaluate import (evaluate_closerthan_thresh, evaluate_closerthan_thresh_batch, evaluate_nearest_distance,
+                      evaluate_nearest_distance_batch)
+
+DIST = {1: 1, 2: 2, 3: 2, 4: 1}
+
+
+def solved_seatings(venue, samples=6):
+    """
+    solved copies of venue for a range of ticket counts and both a spread out and a packed solver
+    """
+    seatings = []
+    for i in range(samples):
+        np.random.seed(i)
+        seating = copy.deepcopy(venue)
+        solver_cls = ExhaustiveGreedySolver if i % 2 == 0 else NaiveSolver
+        solver_cls(seating, BaseAttendees.from_probs(DIST, 8 + 6 * i)).solve()
+        seatings.append(seating)
+    return seatings
+
+
+@pytest.mark.parametrize('venue', ['blocks', 'lengthwidth'])
+@pytest.mark.parametrize('threshold', [1.5, 2.5])
+def test_batch_evaluation_matches_scalar(venue, threshold):
+    blocks = BaseSeating.from_regular_blocks((5, 6), (2, 2))
+    if venue == 'lengthwidth':
+        blocks = LengthWidthSeating(blocks.totalseats, blocks.seating, 1.3, 0.7)
+    seatings = solved_seatings(blocks)
+    grids = np.stack([seating.seating for seating in seatings])
+
+    nearest = evaluate_nearest_distance_batch(grids, blocks)
+    assert np.allclose(nearest, [evaluate_nearest_distance(seating) for seating in seatings])
+    for reduce_ in ['mean', 'sum', 'boolean']:
+        batch = evaluate_closerthan_thresh_batch(grids, blocks, threshold, reduce_)
+        scalar = [evaluate_closerthan_thresh(seating, threshold, reduce_) for seating in seatings]
+        assert np.allclose(batch, scalar)
@@ -0,0 +1,72 @@
+import copy
+import pickle
+
+import numpy as np
+import pytest
+
+from Attendees import BaseAttendees
+from Seating import BaseSeating, LengthWidthSeating, SharedSeating
+from Solvers import ExhaustiveGreedySolver, ThresholdSolver
+
+DIST = {1: 1, 2: 2, 3: 2, 4: 1}
+
+
+def test_layout_round_trip_is_memory_mapped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    blocks = BaseSeating.from_regular_blocks((4, 5), (2, 2))
+    seating = LengthWidthSeating(blocks.totalseats, blocks.seating, 1.2, 0.8)
+    seating.add_layer('risk', np.linspace(0, 1, seating.seating.size).reshape(seating.seating.shape))
+    seating.to_layout('venue', dtype=np.int16)
+
+    loaded = LengthWidthSeating.from_layout('venue', mmap_mode='r')
+    assert isinstance(loaded.seating, np.memmap)
+    assert loaded.seating.dtype == np.int16
+    assert not loaded.seating.flags.writeable
+    assert np.array_equal(loaded.seating, seating.seating)
+    assert (loaded.totalseats, loaded.seatlen, loaded.seatwidth) == (seating.totalseats, 1.2, 0.8)
+    assert np.allclose(loaded.layers['risk'], seating.layers['risk'])
+    assert loaded.emptyseatcoords == seating.emptyseatcoords
+
+    # copy-on-write maps can be seated without touching the file
+    writable = LengthWidthSeating.from_layout('venue')
+    writable.add_person(0, 0, 1)
+    assert np.array_equal(LengthWidthSeating.from_layout('venue', mmap_mode='r').seating, seating.seating)
+
+
+def test_layout_version_mismatch_raises(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    BaseSeating.from_regular_blocks((3, 3), (1, 2)).to_layout('venue')
+    meta = (tmp_path / 'saved' / 'layouts' / 'venue.json')
+    meta.write_text(meta.read_text().replace('"version": 1', '"version": 0'))
+    with pytest.raises(ValueError):
+        BaseSeating.from_layout('venue')
+
+
+@pytest.mark.parametrize('solver_cls', [ExhaustiveGreedySolver, ThresholdSolver])
+def test_compact_and_shared_seatings_solve_like_the_base_seating(solver_cls):
+    np.random.seed(0)
+    attendees = BaseAttendees.from_probs(DIST, 40)
+
+    base = BaseSeating.from_regular_blocks((6, 6), (2, 2))
+    solver_cls(base, copy.deepcopy(attendees)).solve()
+
+    compact = BaseSeating.from_regular_blocks((6, 6), (2, 2), compact=True)
+    solver_cls(compact, copy.deepcopy(attendees)).solve()
+    assert compact.seating.dtype == np.int16
+    assert np.array_equal(compact.seating, base.seating)
+
+    venue = BaseSeating.from_regular_blocks((6, 6), (2, 2)).to_shared()
+    try:
+        shared = SharedSeating(venue)
+        solver_cls(shared, copy.deepcopy(attendees)).solve()
+        assert np.array_equal(shared.seating, base.seating)
+        assert shared.unfilledseats == base.unfilledseats
+        assert set(shared.emptyseatcoords) == base.emptyseatcoords
+
+        # pickles and copies only carry the occupancy, and read the same venue
+        restored = pickle.loads(pickle.dumps(shared))
+        assert restored.occupancy == shared.occupancy
+        assert np.array_equal(copy.deepcopy(shared).seating, base.seating)
+        del shared, restored
+    finally:
+        venue.unlink()
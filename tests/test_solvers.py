@@ -0,0 +1,148 @@
+import copy
+import os
+
+import numpy as np
+import pytest
+
+from Attendees import BaseAttendees
+from Seating import BaseSeating
+from Solvers import (AutoSolver, BeamSolver, ExhaustiveGreedySolver, LazyGreedySolver, NaiveSolver, PortfolioSolver,
+                     PrioritySolver, SolveCache, ThresholdSolver, TilingSolver, calibrate)
+from evaluate import evaluate_closerthan_thresh
+from utils import FOOTPRINTS
+
+DIST = {1: 1, 2: 2, 3: 2, 4: 1}
+
+
+def draw(count, seed=0):
+    np.random.seed(seed)
+    return BaseAttendees.from_probs(DIST, count)
+
+
+def assert_seated(seating, attendees, results):
+    """
+    checks that every group was seated once, in one of the footprints of its size, and that the
+    grid holds exactly the seats yielded by solve_iter
+    """
+    assert attendees.check_complete()
+    assert sorted(size for _, size, _, _ in results) == sorted(attendees.init_groups)
+    for groupid, size, coords, metrics in results:
+        xs, ys = zip(*coords)
+        offsets = tuple(sorted((x - min(xs), y - min(ys)) for x, y in coords))
+        assert offsets in [tuple(sorted(footprint)) for footprint in FOOTPRINTS[size]]
+        assert all(seating.seating[x, y] == groupid for x, y in coords)
+        assert 'unfilledseats' in metrics
+    assert (seating.seating > 0).sum() == sum(attendees.init_groups)
+
+
+@pytest.mark.parametrize('solver_cls, kwargs', [
+    (LazyGreedySolver, {}),
+    (BeamSolver, {'beam_width': 3}),
+    (ThresholdSolver, {'threshold': 1.5}),
+    (TilingSolver, {'threshold': 1.5}),
+])
+@pytest.mark.parametrize('count', [40, 70])
+def test_solvers_seat_everyone_without_violations(solver_cls, kwargs, count):
+    seating = BaseSeating.from_regular_blocks((5, 5), (3, 3))
+    attendees = draw(count)
+    results = list(solver_cls(seating, attendees).solve_iter(**kwargs))
+    assert_seated(seating, attendees, results)
+    assert evaluate_closerthan_thresh(seating, 1.5, reduce_='boolean')
+
+
+def test_threshold_solver_reports_violations():
+    seating = BaseSeating.from_regular_blocks((5, 5), (3, 3))
+    attendees = draw(120)
+    solver = ThresholdSolver(seating, attendees)
+    results = list(solver.solve_iter(threshold=1.5))
+    assert_seated(seating, attendees, results)
+    assert not solver.violation_free
+    assert not solver.can_place(4)
+    # groups are only flagged once the first one had to be placed on blocked seats
+    flags = [metrics['violation_free'] for _, _, _, metrics in results]
+    assert flags == sorted(flags, reverse=True)
+
+
+def test_lazy_solver_keeps_exhaustive_scores():
+    # both solvers place every group at a position of greatest summed distance, so they only
+    # differ in ties and end up with nearly the same distance
+    seating = BaseSeating.from_json('smallconcertseating.json')
+    exhaustive, lazy = copy.deepcopy(seating), copy.deepcopy(seating)
+    exhaustive_results = list(ExhaustiveGreedySolver(exhaustive, draw(40)).solve_iter())
+    lazy_results = list(LazyGreedySolver(lazy, draw(40)).solve_iter())
+    assert exhaustive_results[0][2] == lazy_results[0][2]
+    assert lazy_results[1][3]['distance'] == pytest.approx(exhaustive_results[1][3]['distance'])
+
+
+def test_priority_solver_heap_follows_layer_weights():
+    seating = BaseSeating.from_regular_blocks((4, 4), (3, 3))
+    layer = np.zeros(seating.seating.shape)
+    layer[10, 10] = 5
+    seating.add_layer('air', layer)
+    results = list(PrioritySolver(seating, draw(3), layer_weights={'air': 1}).solve_iter())
+    assert (10, 10) in results[0][2]
+
+
+def test_cache_hit_replays_the_solve():
+    seating = BaseSeating.from_json('smallconcertseating.json')
+    cache = SolveCache()
+    attendees = draw(40, seed=3)
+
+    uncached = list(ExhaustiveGreedySolver(copy.deepcopy(seating), copy.deepcopy(attendees)).solve_iter())
+    first = list(ExhaustiveGreedySolver(copy.deepcopy(seating), copy.deepcopy(attendees)).solve_iter(cache=cache))
+    solved = copy.deepcopy(seating)
+    solver = ExhaustiveGreedySolver(solved, copy.deepcopy(attendees))
+    hit = list(solver.solve_iter(cache=cache))
+    assert len(cache) == 1
+    assert cache.get(solver.cache_key) is not None
+    for results in [first, hit]:
+        assert [(groupid, size, coords) for groupid, size, coords, _ in results] == \
+               [(groupid, size, coords) for groupid, size, coords, _ in uncached]
+        assert [metrics for _, _, _, metrics in results] == [metrics for _, _, _, metrics in uncached]
+
+    # dropping the smallest group keeps the placements of all the larger groups
+    fewer = copy.deepcopy(attendees)
+    fewer.groups.remove(min(fewer.groups))
+    fewer.init_groups = list(fewer.groups)
+    partial = list(ExhaustiveGreedySolver(copy.deepcopy(seating), copy.deepcopy(fewer)).solve_iter(cache=cache))
+    fresh = list(ExhaustiveGreedySolver(copy.deepcopy(seating), copy.deepcopy(fewer)).solve_iter())
+    assert [coords for _, _, coords, _ in partial] == [coords for _, _, coords, _ in fresh]
+    assert len(cache) == 2
+
+
+def test_portfolio_solver_applies_the_best_run():
+    seating = BaseSeating.from_regular_blocks((5, 5), (2, 2))
+    attendees = draw(30)
+    configs = [(ExhaustiveGreedySolver, {'order': 'descending'}), (NaiveSolver, {})]
+    solver = PortfolioSolver(seating, attendees)
+    results = list(solver.solve_iter(configs=configs, restarts=1, deadline=60, processes=2,
+                                     stop_on_feasible=False))
+    assert_seated(seating, attendees, results)
+    assert solver.errors == []
+    assert len(solver.results) == 3
+    best = max(solver.results, key=lambda result: (result[2] == 0, result[1]))
+    assert solver.best_config == best[0]
+
+
+def test_auto_solver_needs_a_calibration(tmp_path):
+    seating = BaseSeating.from_regular_blocks((3, 3), (2, 2))
+    with pytest.raises(FileNotFoundError):
+        AutoSolver(seating, draw(6)).solve(calibration=str(tmp_path / 'calibration.json'))
+
+    path = str(tmp_path / 'calibration.json')
+    calibration = calibrate(path, tilings=((1, 1), (2, 2)), occupancies=(0.3,),
+                            configs=['exhaustive-edt', 'naive'], verbose=False)
+    assert os.path.exists(path)
+    assert sorted(calibration['configs']) == ['exhaustive-edt', 'naive']
+
+    attendees = draw(6)
+    solver = AutoSolver(seating, attendees)
+    results = list(solver.solve_iter(calibration=path))
+    assert solver.config in calibration['configs']
+    assert_seated(seating, attendees, results)
+
+
+def test_calibrate_raises_when_nothing_could_be_timed():
+    # the pdist backend is only calibrated up to CALIBRATION_MAX_SEATS
+    with pytest.raises(RuntimeError):
+        calibrate(None, tilings=((4, 4),), occupancies=(0.3,), configs=['exhaustive-pdist'], verbose=False)
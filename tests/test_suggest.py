@@ -0,0 +1,98 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from Attendees import BaseAttendees
+from Seating import BaseSeating
+from Solvers import ExhaustiveGreedySolver
+from evaluate import evaluate_closerthan_thresh
+from results import BootstrapLog, SeatingStore
+from suggest import capacity_upper_bound, suggest_n_tickets
+
+DIST = {1: 1, 2: 2, 3: 2, 4: 1}
+
+
+def solver_capacity(seating, threshold, samples=5):
+    """
+    largest ticket count for which any of samples draws is seated without violations
+    """
+    best = 0
+    for count in range(1, int(seating.totalseats) + 1):
+        for seed in range(samples):
+            np.random.seed(seed)
+            solved = copy.deepcopy(seating)
+            ExhaustiveGreedySolver(solved, BaseAttendees.from_probs(DIST, count)).solve()
+            if evaluate_closerthan_thresh(solved, threshold, reduce_='boolean'):
+                best = count
+                break
+        if count > best + 8:
+            break
+    return best
+
+
+@pytest.mark.parametrize('venue', ['plane', 'blocks'])
+@pytest.mark.parametrize('threshold', [1.5, 2.5])
+def test_capacity_upper_bound_is_sound_and_tight(venue, threshold):
+    if venue == 'plane':
+        seating = BaseSeating.from_json('simple_plane.json')
+    else:
+        seating = BaseSeating.from_regular_blocks((5, 5), (2, 2))
+    bound = capacity_upper_bound(DIST, seating, threshold)
+    capacity = solver_capacity(seating, threshold)
+    assert bound >= capacity
+    assert bound <= 1.5 * capacity + max(DIST)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def search(name, stop_after=None, resume=False):
+    """
+    runs suggest_n_tickets with a checkpoint, store, log and heatmaps, raising Interrupted after
+    stop_after bootstrap samples if given. Returns (suggestion, store, log, heatmaps)
+    """
+    store, log, heatmaps = SeatingStore(name), BootstrapLog(name, flush_every=7), {}
+    samples = [0]
+
+    def callback(event):
+        if event['event'] == 'sample':
+            samples[0] += 1
+            if samples[0] == stop_after:
+                raise Interrupted
+
+    np.random.seed(0)
+    random.seed(0)
+    seating = BaseSeating.from_regular_blocks((4, 4), (2, 2))
+    try:
+        suggestion = suggest_n_tickets({1: 1, 2: 1}, seating, 12, verbose=False, store=store, log=log,
+                                       heatmaps=heatmaps, checkpoint='{}.pkl'.format(name), resume=resume,
+                                       checkpoint_every=4, callback=callback)
+    except Interrupted:
+        suggestion = None
+    store.flush()
+    log.flush()
+    return suggestion, store, log, heatmaps
+
+
+def test_resumed_search_does_not_count_samples_twice(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected, store, log, heatmaps = search('full')
+
+    # interrupted between two checkpoints, so some samples were written after the last save
+    assert search('resumed', stop_after=18)[0] is None
+    suggestion, resumed_store, resumed_log, resumed_heatmaps = search('resumed', resume=True)
+
+    assert suggestion == expected
+    assert len(resumed_store) == len(store)
+    assert np.array_equal(resumed_store.load()['groupids'], store.load()['groupids'])
+    rows, resumed_rows = log.read(), resumed_log.read()
+    assert len(resumed_rows['sample']) == len(rows['sample'])
+    for column in rows:
+        assert np.array_equal(np.sort(resumed_rows[column]), np.sort(rows[column]))
+    assert sorted(resumed_heatmaps) == sorted(heatmaps)
+    for count in heatmaps:
+        assert resumed_heatmaps[count].samples == heatmaps[count].samples
+        assert np.array_equal(resumed_heatmaps[count].occupied, heatmaps[count].occupied)
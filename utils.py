@@ -1,4 +1,16 @@
 from heapq import heappush, heappop, heapify
+import random
+from bisect import bisect_left, bisect_right, insort
+import numpy as np
+
+# footprints of the supported group sizes, as (dx, dy) offsets from the upper left seat.
+# groups of 2 and 3 sit in a row, groups of 4 sit in a row or in a 2-2 box
+FOOTPRINTS = {
+    1: [((0, 0),)],
+    2: [((0, 0), (1, 0))],
+    3: [((0, 0), (1, 0), (2, 0))],
+    4: [((0, 0), (1, 0), (2, 0), (3, 0)), ((0, 0), (1, 0), (0, 1), (1, 1))]
+}
 
 class MaxHeap():
     """
@@ -50,4 +62,252 @@ class MaxHeap():
         Restores heap state, to be called by user after setter methods have 
         changed priorities in the heap
         """
-        heapify(self._heap)
\ No newline at end of file
+        heapify(self._heap)
+
+
+class RunIndex():
+    """
+    An index of the maximal runs of consecutive empty seats along x, in each row y of a seating.
+    Runs are also kept in a list sorted by length, so finding every run of at least a given
+    length costs time proportional to the answer rather than to the size of the seating.
+
+    No public attributes
+
+    Methods
+    -------
+    run_at(x, y)
+        returns (start_x, length) of the run containing seat (x, y), or None if it is not empty
+
+    take(x, y)
+        removes seat (x, y) from its run, splitting the run in two
+
+    runs(min_length)
+        returns the runs of at least min_length seats as (length, y, start_x) tuples
+
+    positions(size)
+        yields every (start_x, y) where size consecutive empty seats start
+
+    copy()
+        returns an independent copy of the index
+    """
+
+    def __init__(self, mask):
+        """
+        Creates the index from a boolean array that is True at the empty seats
+        """
+        self._starts = {} # y -> sorted list of the starts of the runs in row y
+        self._lengths = {} # (start_x, y) -> length of the run
+        self._sorted = [] # (length, y, start_x) for every run, sorted
+
+        for y in range(mask.shape[1]):
+            # runs begin where the row goes from not empty to empty, and end where it goes back
+            edges = np.diff(np.concatenate(([0], mask[:, y].astype(np.int8), [0])))
+            starts = np.where(edges == 1)[0]
+            ends = np.where(edges == -1)[0]
+            self._starts[y] = []
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self._add(start, y, end - start)
+        self._sorted.sort()
+
+    def _add(self, start, y, length):
+        insort(self._starts[y], start)
+        self._lengths[(start, y)] = length
+        self._sorted.append((length, y, start))
+
+    def run_at(self, x, y):
+        """
+        returns (start_x, length) of the run containing seat (x, y), or None if (x, y) is 
+        not an empty seat
+        """
+        starts = self._starts.get(y)
+        if not starts:
+            return None
+        i = bisect_right(starts, x) - 1
+        if i < 0:
+            return None
+        start = starts[i]
+        length = self._lengths[(start, y)]
+        if x < start + length:
+            return start, length
+        return None
+
+    def take(self, x, y):
+        """
+        removes seat (x, y) from the run containing it, leaving the seats on either side
+        of it as (up to) two shorter runs
+        """
+        x, y = int(x), int(y)
+        start, length = self.run_at(x, y)
+
+        # remove the run from all three structures
+        self._starts[y].remove(start)
+        del self._lengths[(start, y)]
+        del self._sorted[bisect_left(self._sorted, (length, y, start))]
+
+        # add back the parts to the left and right of (x, y)
+        for new_start, new_length in ((start, x - start), (x + 1, start + length - x - 1)):
+            if new_length > 0:
+                insort(self._starts[y], new_start)
+                self._lengths[(new_start, y)] = new_length
+                insort(self._sorted, (new_length, y, new_start))
+
+    def runs(self, min_length):
+        """
+        returns the runs with at least min_length seats, as (length, y, start_x) tuples
+        sorted by length
+        """
+        return self._sorted[bisect_left(self._sorted, (min_length,)):]
+
+    def positions(self, size):
+        """
+        yields every (start_x, y) such that the seats [start_x, start_x+size) in row y are empty
+        """
+        for length, y, start in self.runs(size):
+            for start_x in range(start, start + length - size + 1):
+                yield start_x, y
+
+    def copy(self):
+        """
+        returns an independent copy of the index, without rescanning the seating
+        """
+        index = RunIndex.__new__(RunIndex)
+        index._starts = {y: list(starts) for y, starts in self._starts.items()}
+        index._lengths = dict(self._lengths)
+        index._sorted = list(self._sorted)
+        return index
+
+
+class SampleSet():
+    """
+    A set that supports adding, removing and drawing a uniformly random item in O(1), by keeping
+    the items in a list and their positions in a dict. Removing swaps the last item into the
+    removed item's slot. 
+
+    No public attributes
+
+    Methods
+    -------
+    add(item)
+        adds item if it is not already in the set
+
+    discard(item)
+        removes item if it is in the set
+
+    sample()
+        returns a uniformly random item, without removing it
+    """
+
+    def __init__(self, items=()):
+        """
+        Creates the set from an iterable of hashable items
+        """
+        self._items = []
+        self._index = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, item):
+        """
+        adds item to the set, does nothing if it is already there
+        """
+        if item not in self._index:
+            self._index[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item):
+        """
+        removes item from the set, does nothing if it is not there
+        """
+        i = self._index.pop(item, None)
+        if i is None:
+            return
+        last = self._items.pop()
+        if i < len(self._items):
+            # move the last item into the hole
+            self._items[i] = last
+            self._index[last] = i
+
+    def sample(self):
+        """
+        returns a uniformly random item of the set, raises IndexError if it is empty
+        """
+        if len(self._items) == 0:
+            raise IndexError('sample from an empty SampleSet')
+        return self._items[random.randrange(len(self._items))]
+
+
+def footprint_starts(mask, footprint):
+    """
+    Takes a boolean mask of usable seats and a footprint, and returns a boolean array of the same
+    shape that is True at (x, y) if every seat of the footprint is usable when its upper left
+    seat is placed at (x, y)
+    """
+    starts = np.zeros(mask.shape, dtype=bool)
+    width = max(dx for dx, _ in footprint) + 1
+    height = max(dy for _, dy in footprint) + 1
+    xlen, ylen = mask.shape[0] - width + 1, mask.shape[1] - height + 1
+    if xlen <= 0 or ylen <= 0:
+        return starts
+
+    # and together the mask shifted by each offset of the footprint
+    valid = np.ones((xlen, ylen), dtype=bool)
+    for dx, dy in footprint:
+        valid &= mask[dx : dx + xlen, dy : dy + ylen]
+    starts[:xlen, :ylen] = valid
+    return starts
+
+def footprint_sums(values, footprint):
+    """
+    Returns an array of the same shape as values that holds, at (x, y), the sum of values over
+    the footprint placed with its upper left seat at (x, y). Entries where the footprint does
+    not fit in the grid are 0
+    """
+    sums = np.zeros(values.shape, dtype=values.dtype)
+    width = max(dx for dx, _ in footprint) + 1
+    height = max(dy for _, dy in footprint) + 1
+    xlen, ylen = values.shape[0] - width + 1, values.shape[1] - height + 1
+    if xlen <= 0 or ylen <= 0:
+        return sums
+
+    for dx, dy in footprint:
+        sums[:xlen, :ylen] += values[dx : dx + xlen, dy : dy + ylen]
+    return sums
+
+def get_seat_scale(seating):
+    """
+    Returns the (x, y) size of one grid step of a seating, taking into account non-unit seat 
+    dimensions
+    """
+    if 'seatlen' in seating.__dict__.keys():
+        return seating.seatwidth, seating.seatlen
+    return 1, 1
+
+def disk_stencil(radius, scale=(1, 1)):
+    """
+    Returns a boolean array that is True at every grid offset from its center seat whose distance
+    is at most radius, where one grid step is scale[0] in x and scale[1] in y
+    """
+    xreach = int(np.floor(radius / scale[0]))
+    yreach = int(np.floor(radius / scale[1]))
+    dx, dy = np.meshgrid(np.arange(-xreach, xreach + 1), np.arange(-yreach, yreach + 1), indexing='ij')
+    return np.sqrt((dx * scale[0]) ** 2 + (dy * scale[1]) ** 2) <= radius
+
+def stamp(mask, x, y, stencil):
+    """
+    Sets mask to True wherever the stencil covers it when centered on (x, y), clipping
+    the stencil at the edges of mask
+    """
+    xreach, yreach = stencil.shape[0] // 2, stencil.shape[1] // 2
+    xlo, xhi = max(0, x - xreach), min(mask.shape[0], x + xreach + 1)
+    ylo, yhi = max(0, y - yreach), min(mask.shape[1], y + yreach + 1)
+    mask[xlo:xhi, ylo:yhi] |= stencil[xlo - (x - xreach) : xhi - (x - xreach),
+                                      ylo - (y - yreach) : yhi - (y - yreach)]